@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+
+from foodgram.cache import LRUCache, is_shared_cache
+
+TOKEN_CACHE_KEY = 'auth:token:{}'
+
+local_tokens = LRUCache(
+    settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_LOCAL_TTL
+)
+
+
+def forget_tokens(keys):
+    """Drop tokens from the shared and this process caches."""
+    keys = list(keys)
+    cache.delete_many([TOKEN_CACHE_KEY.format(key) for key in keys])
+    for key in keys:
+        local_tokens.delete(key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication with cached token and user lookups.
+
+    Tokens live in a small per-process LRU in front of the shared cache.
+    Other processes may keep a dropped token up to TOKEN_CACHE_LOCAL_TTL.
+    Without a shared cache tokens are not cached: forget_tokens could not
+    reach the other workers.
+    """
+
+    def authenticate_credentials(self, key):
+        if not is_shared_cache():
+            return super().authenticate_credentials(key)
+        token = local_tokens.get(key)
+        if token is None:
+            token = cache.get(TOKEN_CACHE_KEY.format(key))
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            cache.set(
+                TOKEN_CACHE_KEY.format(key), token, settings.TOKEN_CACHE_TTL
+            )
+        local_tokens.set(key, token)
+        return (token.user, token)
@@ -0,0 +1,68 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from foodgram.cache import LRUCache
+from users.models import Follow, User
+
+AUTHOR_CARD_KEY = 'author_card:{}'
+AUTHOR_CARD_FIELDS = ('email', 'id', 'username', 'first_name', 'last_name')
+
+local_cards = LRUCache(
+    settings.AUTHOR_CARD_CACHE_SIZE, settings.AUTHOR_CARD_LOCAL_TTL
+)
+
+
+def get_card(user):
+    return {name: getattr(user, name) for name in AUTHOR_CARD_FIELDS}
+
+
+def get_author_cards(author_ids):
+    """Profile cards by author id, without the viewer's is_subscribed.
+
+    Cards come from this process LRU, then one get_many on the shared
+    cache, then one query for the rest. Unknown ids are left out.
+    """
+    author_ids = set(author_ids)
+    cards = local_cards.get_many(author_ids)
+    missing = author_ids - cards.keys()
+    if missing:
+        for card in cache.get_many(
+            [AUTHOR_CARD_KEY.format(pk) for pk in missing]
+        ).values():
+            cards[card['id']] = card
+            local_cards.set(card['id'], card)
+        missing -= cards.keys()
+    if missing:
+        loaded = {
+            card['id']: card
+            for card in User.objects.filter(
+                pk__in=missing
+            ).values(*AUTHOR_CARD_FIELDS)
+        }
+        cache.set_many(
+            {AUTHOR_CARD_KEY.format(pk): card for pk, card in loaded.items()},
+            settings.AUTHOR_CARD_TTL
+        )
+        for pk, card in loaded.items():
+            local_cards.set(pk, card)
+        cards.update(loaded)
+    return cards
+
+
+def forget_author_cards(author_ids):
+    """Drop cards from the shared and this process caches."""
+    author_ids = list(author_ids)
+    cache.delete_many([AUTHOR_CARD_KEY.format(pk) for pk in author_ids])
+    for pk in author_ids:
+        local_cards.delete(pk)
+
+
+def get_subscribed_ids(user, author_ids):
+    """Ids of the authors user is subscribed to."""
+    if not user.is_authenticated:
+        return set()
+    return set(
+        Follow.objects.filter(
+            user=user, author_id__in=author_ids
+        ).values_list('author_id', flat=True)
+    )
@@ -0,0 +1,89 @@
+from functools import wraps
+from hashlib import md5
+
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from foodgram.cache import is_shared_cache
+
+USER_CHANGED_KEY = 'conditional:user:{}'
+RECIPES_DELETED_KEY = 'conditional:recipes_deleted'
+
+
+def get_changed_at(key):
+    """Time of the last change tracked under key."""
+    return cache.get_or_set(key, timezone.now, None)
+
+
+def forget_changed_at(key):
+    """Mark a change; the next read records the current time."""
+    cache.delete(key)
+
+
+def get_validators(request, recipes):
+    """ETag and Last-Modified of recipes, without serializing them.
+
+    recipes has the count and last updated_at of the recipes. Besides
+    recipe rows, payloads depend on deleted recipes (for lists) and on
+    the favorites, shopping cart and subscriptions of the user. Their
+    change times are kept in the cache, so without a shared one there
+    are no validators: other workers would not see the changes.
+    """
+    if not recipes['count'] or not is_shared_cache():
+        return None, None
+    changes = [recipes['updated_at'], get_changed_at(RECIPES_DELETED_KEY)]
+    if request.user.is_authenticated:
+        changes.append(
+            get_changed_at(USER_CHANGED_KEY.format(request.user.pk))
+        )
+    last_modified = max(changes)
+    etag = md5(
+        ':'.join(map(str, (
+            request.get_full_path(),
+            request.accepted_media_type,
+            request.user.pk,
+            recipes['count'],
+            *changes,
+        ))).encode()
+    ).hexdigest()
+    return quote_etag(etag), int(last_modified.timestamp())
+
+
+def conditional_recipes(method):
+    """Answer If-None-Match/If-Modified-Since on recipe list and detail."""
+
+    @wraps(method)
+    def wrapper(view, request, *args, **kwargs):
+        lookup = kwargs.get(view.lookup_url_kwarg or view.lookup_field)
+        try:
+            if view.catalog is not None:
+                recipes = view.catalog.get_versions([int(lookup)])
+            else:
+                queryset = view.filter_queryset(view.get_queryset())
+                if lookup is not None:
+                    queryset = queryset.filter(
+                        **{view.lookup_field: lookup}
+                    )
+                recipes = queryset.order_by().aggregate(
+                    updated_at=Max('updated_at'), count=Count('pk')
+                )
+            etag, last_modified = get_validators(request, recipes)
+        except (TypeError, ValueError):
+            etag = last_modified = None
+        response = None
+        if etag is not None:
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+        if response is None:
+            response = method(view, request, *args, **kwargs)
+        if etag is not None and response.status_code in (200, 304):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            patch_vary_headers(response, ('Authorization',))
+        return response
+
+    return wrapper
@@ -0,0 +1,62 @@
+import os
+from datetime import timedelta
+from hashlib import sha256
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.http import HttpResponse
+from django.utils import timezone
+
+DOWNLOAD_DIRECTORIES = ('shopping_lists', 'shared_shopping_lists')
+
+
+def save_download(directory, text):
+    """Store text under a content-hashed name and return its URL for nginx.
+
+    A repeated download reuses the file and marks it as recently used.
+    """
+    digest = sha256(text.encode()).hexdigest()
+    name = f'{settings.PRIVATE_MEDIA_DIR}/{directory}/{digest}.txt'
+    if default_storage.exists(name):
+        os.utime(default_storage.path(name))
+    else:
+        name = default_storage.save(name, ContentFile(text.encode()))
+    return default_storage.url(name)
+
+
+def text_download_response(directory, text):
+    """Plain text attachment, served by nginx when it is enabled."""
+    if settings.USE_X_ACCEL_REDIRECT:
+        response = HttpResponse(content_type='text/plain')
+        response['X-Accel-Redirect'] = save_download(directory, text)
+    else:
+        response = HttpResponse(text, content_type='text/plain')
+    response['content-disposition'] = (
+        'attachment; filename=purchase_list.txt'
+    )
+    return response
+
+
+def prune_downloads(max_age):
+    """Delete download files unused for max_age seconds.
+
+    Files saved before downloads moved under PRIVATE_MEDIA_DIR are
+    pruned as well. Returns the number of files deleted.
+    """
+    expired = timezone.now() - timedelta(seconds=max_age)
+    deleted = 0
+    for directory in DOWNLOAD_DIRECTORIES:
+        for path in (f'{settings.PRIVATE_MEDIA_DIR}/{directory}', directory):
+            if not default_storage.exists(path):
+                continue
+            for filename in default_storage.listdir(path)[1]:
+                name = f'{path}/{filename}'
+                try:
+                    if default_storage.get_modified_time(name) < expired:
+                        default_storage.delete(name)
+                        deleted += 1
+                except FileNotFoundError:
+                    # Deleted by another run_jobs process meanwhile.
+                    pass
+    return deleted
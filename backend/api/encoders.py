@@ -0,0 +1,156 @@
+from collections import defaultdict
+
+from recipes.models import Recipe, RecipeIngredient, Tag
+from recipes.toggles import TOGGLE_MODELS, get_buffer, merge_toggled
+
+from api.cards import get_author_cards, get_subscribed_ids
+
+RECIPE_ROW_FIELDS = (
+    'id', 'author_id', 'name', 'image', 'text', 'cooking_time'
+)
+TAG_FIELDS = ('id', 'name', 'color', 'slug')
+INGREDIENT_FIELDS = (
+    'product_id', 'product__name', 'product__measurement_unit', 'amount'
+)
+
+
+class RecipeEncoder:
+    """Read-only recipe encoder.
+
+    Builds the same payload as RecipeSerializer from `.values()` rows,
+    without model instances or serializer fields. Only the parts named
+    by the FieldSet are queried. With a catalog snapshot, recipes, tags
+    and ingredients are read from it instead.
+    """
+
+    def __init__(self, request, fieldset, catalog=None):
+        self.request = request
+        self.user = request.user
+        self.fieldset = fieldset
+        self.catalog = catalog
+        self.storage = Recipe._meta.get_field('image').storage
+
+    def encode(self, recipe_ids):
+        """Return recipe payloads in the order of recipe_ids."""
+        recipe_ids = list(recipe_ids)
+        if not recipe_ids:
+            return []
+        fieldset = self.fieldset
+        if self.catalog is not None:
+            recipes = self.catalog.get_rows(recipe_ids)
+        else:
+            recipes = {
+                row['id']: row
+                for row in Recipe.objects.filter(
+                    pk__in=recipe_ids
+                ).values(*RECIPE_ROW_FIELDS)
+            }
+        values = {
+            'id': lambda row: row['id'],
+            'name': lambda row: row['name'],
+            'image': lambda row: self.get_image(row['image']),
+            'text': lambda row: row['text'],
+            'cooking_time': lambda row: row['cooking_time'],
+            'author': lambda row: row['author_id'],
+        }
+        if fieldset.is_expanded('author'):
+            authors = self.get_authors(
+                {row['author_id'] for row in recipes.values()}
+            )
+            # Catalog rows of an author soft-deleted since its last
+            # refresh are dropped, as their recipes were deleted too.
+            recipes = {
+                pk: row for pk, row in recipes.items()
+                if row['author_id'] in authors
+            }
+            values['author'] = lambda row: authors[row['author_id']]
+        if 'tags' in fieldset:
+            tags = self.get_tags(
+                recipe_ids, expand=fieldset.is_expanded('tags')
+            )
+            values['tags'] = lambda row: tags[row['id']]
+        if 'ingredients' in fieldset:
+            ingredients = self.get_ingredients(
+                recipe_ids, expand=fieldset.is_expanded('ingredients')
+            )
+            values['ingredients'] = lambda row: ingredients[row['id']]
+        if 'is_favorited' in fieldset:
+            favorited = self.get_user_recipes('favorite', recipe_ids)
+            values['is_favorited'] = lambda row: row['id'] in favorited
+        if 'is_in_shopping_cart' in fieldset:
+            in_shopping_cart = self.get_user_recipes(
+                'shopping_cart', recipe_ids
+            )
+            values['is_in_shopping_cart'] = (
+                lambda row: row['id'] in in_shopping_cart
+            )
+        return [
+            {name: values[name](row) for name in fieldset.names}
+            for row in (recipes[pk] for pk in recipe_ids if pk in recipes)
+        ]
+
+    def get_image(self, name):
+        if not name:
+            return None
+        return self.request.build_absolute_uri(self.storage.url(name))
+
+    def get_tags(self, recipe_ids, expand=True):
+        if self.catalog is not None:
+            return self.catalog.get_tags(recipe_ids, expand)
+        tags = defaultdict(list)
+        rows = Recipe.tags.through.objects.filter(
+            recipe_id__in=recipe_ids
+        ).order_by(
+            *(f'tag__{field}' for field in Tag._meta.ordering)
+        )
+        if not expand:
+            for recipe_id, tag_id in rows.values_list('recipe_id', 'tag_id'):
+                tags[recipe_id].append(tag_id)
+            return tags
+        rows = rows.values_list(
+            'recipe_id', *(f'tag__{field}' for field in TAG_FIELDS)
+        )
+        for recipe_id, *values in rows:
+            tags[recipe_id].append(dict(zip(TAG_FIELDS, values)))
+        return tags
+
+    def get_ingredients(self, recipe_ids, expand=True):
+        if self.catalog is not None:
+            return self.catalog.get_ingredients(recipe_ids, expand)
+        ingredients = defaultdict(list)
+        rows = RecipeIngredient.objects.filter(recipe_id__in=recipe_ids)
+        if not expand:
+            for recipe_id, product_id, amount in rows.values_list(
+                'recipe_id', 'product_id', 'amount'
+            ):
+                ingredients[recipe_id].append(
+                    {'id': product_id, 'amount': amount}
+                )
+            return ingredients
+        rows = rows.values_list('recipe_id', *INGREDIENT_FIELDS)
+        for recipe_id, product_id, name, measurement_unit, amount in rows:
+            ingredients[recipe_id].append({
+                'id': str(product_id),
+                'name': name,
+                'measurement_unit': measurement_unit,
+                'amount': amount,
+            })
+        return ingredients
+
+    def get_authors(self, author_ids):
+        subscribed = get_subscribed_ids(self.user, author_ids)
+        return {
+            pk: {**card, 'is_subscribed': pk in subscribed}
+            for pk, card in get_author_cards(author_ids).items()
+        }
+
+    def get_user_recipes(self, kind, recipe_ids):
+        if not self.user.is_authenticated:
+            return set()
+        return merge_toggled(
+            get_buffer(self.user),
+            kind,
+            TOGGLE_MODELS[kind].objects.filter(
+                user=self.user, recipe_id__in=recipe_ids
+            ).values_list('recipe_id', flat=True),
+        )
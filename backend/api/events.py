@@ -0,0 +1,142 @@
+import asyncio
+import io
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from recipes.events import broker
+from recipes.models import Recipe
+from users.models import Follow
+
+EVENTS_PATH = '/api/recipes/events/'
+
+
+def format_event(message):
+    data = json.dumps({'id': message['id'], 'author': message['author']})
+    return f'id: {message["id"]}\nevent: recipe\ndata: {data}\n\n'.encode()
+
+
+def get_last_event_id(scope):
+    for name, value in scope['headers']:
+        if name == b'last-event-id':
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    return None
+
+
+def open_stream(scope):
+    """Authenticate the request of scope like the API views do.
+
+    Returns the user id, the ids of the authors they follow and the
+    recipes published after Last-Event-ID.
+    """
+    close_old_connections()
+    try:
+        request = Request(
+            ASGIRequest(scope, io.BytesIO()),
+            authenticators=[
+                authentication() for authentication
+                in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+            ],
+        )
+        if not request.user.is_authenticated:
+            raise exceptions.NotAuthenticated
+        author_ids = set(
+            Follow.objects.filter(
+                user=request.user
+            ).values_list('author_id', flat=True)
+        )
+        last_event_id = get_last_event_id(scope)
+        missed = []
+        if last_event_id is not None and author_ids:
+            missed = [
+                {'id': pk, 'author': author_id}
+                for pk, author_id in Recipe.objects.filter(
+                    author_id__in=author_ids, pk__gt=last_event_id
+                ).order_by('pk').values_list(
+                    'pk', 'author_id'
+                )[:settings.EVENTS_BACKLOG_SIZE]
+            ]
+        return request.user.pk, author_ids, missed
+    finally:
+        close_old_connections()
+
+
+async def wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def send_error(send, error):
+    await send({
+        'type': 'http.response.start',
+        'status': error.status_code,
+        'headers': [(b'content-type', b'application/json')],
+    })
+    await send({
+        'type': 'http.response.body',
+        'body': json.dumps({'detail': str(error.detail)}).encode(),
+    })
+
+
+async def recipe_events(scope, receive, send):
+    """Stream new recipes of the authors the user follows as SSE.
+
+    Served straight by the ASGI app so the stream ends as soon as the
+    client disconnects. Events carry the recipe and author ids only;
+    clients fetch the recipes they want to show.
+    """
+    if scope['method'] != 'GET':
+        await send_error(send, exceptions.MethodNotAllowed(scope['method']))
+        return
+    try:
+        user_id, author_ids, missed = await sync_to_async(open_stream)(scope)
+    except exceptions.APIException as error:
+        await send_error(send, error)
+        return
+    queue = asyncio.Queue(settings.EVENTS_QUEUE_SIZE)
+    subscription = broker.subscribe(
+        user_id, author_ids, asyncio.get_running_loop(), queue
+    )
+    disconnected = asyncio.ensure_future(wait_disconnect(receive))
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        body = b'retry: %d\n\n' % (settings.EVENTS_RETRY * 1000)
+        body += b''.join(format_event(message) for message in missed)
+        while True:
+            await send({
+                'type': 'http.response.body', 'body': body, 'more_body': True
+            })
+            received = asyncio.ensure_future(queue.get())
+            await asyncio.wait(
+                (received, disconnected),
+                timeout=settings.EVENTS_HEARTBEAT_INTERVAL,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if disconnected.done():
+                received.cancel()
+                return
+            if received.done():
+                body = format_event(received.result())
+            else:
+                received.cancel()
+                body = b': ping\n\n'
+    finally:
+        broker.unsubscribe(subscription)
+        disconnected.cancel()
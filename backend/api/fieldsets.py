@@ -0,0 +1,62 @@
+from rest_framework import exceptions
+
+RECIPE_FIELDS = (
+    'id',
+    'tags',
+    'author',
+    'ingredients',
+    'is_favorited',
+    'is_in_shopping_cart',
+    'name',
+    'image',
+    'text',
+    'cooking_time',
+)
+RECIPE_RELATIONS = ('tags', 'author', 'ingredients')
+
+SUBSCRIPTION_FIELDS = (
+    'email',
+    'id',
+    'username',
+    'first_name',
+    'last_name',
+    'is_subscribed',
+    'recipes',
+    'recipes_count',
+)
+SUBSCRIPTION_RELATIONS = ('recipes',)
+
+
+def parse_names(request, param, allowed):
+    value = request.query_params.get(param)
+    if value is None:
+        return None
+    names = {name.strip() for name in value.split(',') if name.strip()}
+    unknown = names - set(allowed)
+    if unknown:
+        raise exceptions.ValidationError(
+            {param: f'Unknown names: {", ".join(sorted(unknown))}.'}
+        )
+    return names
+
+
+class FieldSet:
+    """Fields and expanded relations requested with ?fields= and ?expand=.
+
+    None means everything, which keeps the full payload by default.
+    Relations that are requested but not expanded are rendered as ids.
+    """
+
+    def __init__(self, request, fields, relations):
+        self.fields = parse_names(request, 'fields', fields)
+        self.expand = parse_names(request, 'expand', relations)
+        self.names = [
+            name for name in fields
+            if self.fields is None or name in self.fields
+        ]
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def is_expanded(self, name):
+        return name in self and (self.expand is None or name in self.expand)
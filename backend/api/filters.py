@@ -1,6 +1,29 @@
+from django.conf import settings
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet, filters
 
+from recipes.catalog import get_catalog
 from recipes.models import Ingredient, Recipe, Tag
+from recipes.toggles import filter_toggled
+
+TAGS_MODE_ANY = 'any'
+TAGS_MODE_ALL = 'all'
+TAGS_MODES = (
+    (TAGS_MODE_ANY, 'Any of the tags'),
+    (TAGS_MODE_ALL, 'All of the tags'),
+)
+# Each ordering is backed by a (field, id) index.
+RECIPE_ORDERING_FIELDS = {
+    'pub_date': 'pub_date',
+    'cooking_time': 'cooking_time',
+    'name': 'name',
+    'popularity': 'favorites_count',
+}
+RECIPE_ORDERINGS = tuple(
+    (f'{prefix}{name}', f'{prefix}{name}')
+    for name in RECIPE_ORDERING_FIELDS
+    for prefix in ('', '-')
+)
 
 
 class IngredientFilter(FilterSet):
@@ -17,30 +40,98 @@ class IngredientFilter(FilterSet):
 
 
 class RecipiesFilter(FilterSet):
-    """Recipe filter for tag, favorite and shopping_cart."""
+    """Recipe filters, ranges and ordering."""
 
     tags = filters.ModelMultipleChoiceFilter(
         queryset=Tag.objects.all(),
         field_name='tags__slug',
         to_field_name="slug",
+        method='get_filter_tags',
+    )
+    tags_mode = filters.ChoiceFilter(
+        choices=TAGS_MODES,
+        method='get_filter_tags_mode',
     )
     is_favorited = filters.BooleanFilter(method='get_filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_filter_is_in_shopping_cart'
     )
+    calories_min = filters.NumberFilter(
+        field_name='calories', lookup_expr='gte'
+    )
+    calories_max = filters.NumberFilter(
+        field_name='calories', lookup_expr='lte'
+    )
+    cost_min = filters.NumberFilter(field_name='cost', lookup_expr='gte')
+    cost_max = filters.NumberFilter(field_name='cost', lookup_expr='lte')
+    cooking_time__gte = filters.NumberFilter(
+        field_name='cooking_time', lookup_expr='gte'
+    )
+    cooking_time__lte = filters.NumberFilter(
+        field_name='cooking_time', lookup_expr='lte'
+    )
+    pub_date__gte = filters.IsoDateTimeFilter(
+        field_name='pub_date', lookup_expr='gte'
+    )
+    pub_date__lte = filters.IsoDateTimeFilter(
+        field_name='pub_date', lookup_expr='lte'
+    )
+    ordering = filters.ChoiceFilter(
+        choices=RECIPE_ORDERINGS,
+        method='get_filter_ordering',
+    )
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'tags', 'tags_mode', 'author', 'is_favorited',
+            'is_in_shopping_cart', 'calories_min', 'calories_max',
+            'cost_min', 'cost_max', 'cooking_time__gte', 'cooking_time__lte',
+            'pub_date__gte', 'pub_date__lte', 'ordering'
+        )
+
+    def get_filter_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        match_all = self.form.cleaned_data.get('tags_mode') == TAGS_MODE_ALL
+        catalog = get_catalog()
+        if catalog is not None:
+            # A short list of ids beats joining the tags of every recipe.
+            recipe_ids = catalog.get_tagged(
+                [tag.pk for tag in value], match_all
+            )
+            if len(recipe_ids) <= settings.CATALOG_FILTER_MAX_IDS:
+                return queryset.filter(pk__in=recipe_ids)
+        recipe_tags = Recipe.tags.through.objects.filter(
+            recipe_id=OuterRef('pk')
+        )
+        if match_all:
+            for tag in value:
+                queryset = queryset.filter(
+                    Exists(recipe_tags.filter(tag_id=tag.pk))
+                )
+            return queryset
+        return queryset.filter(
+            Exists(recipe_tags.filter(tag_id__in=[tag.pk for tag in value]))
+        )
+
+    def get_filter_tags_mode(self, queryset, name, value):
+        return queryset
+
+    def get_filter_ordering(self, queryset, name, value):
+        prefix = '-' if value.startswith('-') else ''
+        field = RECIPE_ORDERING_FIELDS[value.lstrip('-')]
+        # The id keeps pages stable among equal values.
+        return queryset.order_by(f'{prefix}{field}', f'{prefix}id')
 
     def get_filter_is_favorited(self, queryset, name, value):
         user = self.request.user
         if value and user.is_authenticated:
-            return queryset.filter(favorites__user=user)
+            return filter_toggled(queryset, user, 'favorite')
         return queryset
 
     def get_filter_is_in_shopping_cart(self, queryset, name, value):
         user = self.request.user
         if value and user.is_authenticated:
-            return queryset.filter(shopping_cart__user=user)
+            return filter_toggled(queryset, user, 'shopping_cart')
         return queryset
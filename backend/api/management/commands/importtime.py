@@ -0,0 +1,88 @@
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+IMPORT_TIME = re.compile(r'import time:\s+(\d+) \|\s+\d+ \|( *)(\S+)')
+
+
+def parse_import_times(log):
+    """(self microseconds, module, importer) rows of a -X importtime log.
+
+    Modules are logged after the ones they import, so the importer of a
+    row is the next row with a smaller indent.
+    """
+    rows = [
+        (int(match[1]), len(match[2]), match[3])
+        for match in map(IMPORT_TIME.match, log.splitlines())
+        if match
+    ]
+    stack, parsed = [], []
+    for self_time, indent, module in reversed(rows):
+        while stack and stack[-1][0] >= indent:
+            stack.pop()
+        parsed.append((self_time, module, stack[-1][1] if stack else None))
+        stack.append((indent, module))
+    return parsed
+
+
+def get_importer_packages(importers, module):
+    """Packages whose imports led to module, nearest first."""
+    packages = [module.partition('.')[0]]
+    seen = {module}
+    importer = importers.get(module)
+    while importer and importer not in seen:
+        package = importer.partition('.')[0]
+        if package != packages[-1]:
+            packages.append(package)
+        seen.add(importer)
+        importer = importers.get(importer)
+    return packages[1:]
+
+
+class Command(BaseCommand):
+    help = "Report the import time of a web worker start by package"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=20,
+            help='Packages listed.',
+        )
+
+    def handle(self, *args, **options):
+        module = settings.WSGI_APPLICATION.rpartition('.')[0]
+        env = dict(os.environ)
+        # As gunicorn.conf.py sets it for the workers.
+        env.setdefault('ADMIN_LAZY_DISCOVERY', 'true')
+        process = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            cwd=settings.BASE_DIR,
+            env=env,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        if process.returncode:
+            raise CommandError(process.stderr[-2000:])
+        rows = parse_import_times(process.stderr)
+        importers = dict((module, importer) for _, module, importer in rows)
+        times = defaultdict(int)
+        for self_time, module, _ in rows:
+            times[module.partition('.')[0]] += self_time
+        self.stdout.write(
+            f"Imports took {sum(times.values()) / 1000:.0f} ms "
+            f"in {len(rows)} modules."
+        )
+        for package, self_time in sorted(
+            times.items(), key=lambda item: -item[1]
+        )[:options['limit']]:
+            line = f"{self_time / 1000:8.1f} ms  {package}"
+            via = get_importer_packages(importers, package)
+            if via:
+                line += f"  <- {' <- '.join(via)}"
+            self.stdout.write(line)
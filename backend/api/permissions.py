@@ -11,3 +11,11 @@ class RecipePermission(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         return (request.method in permissions.SAFE_METHODS
                 or (obj.author == request.user))
+
+
+class ShoppingListPermission(permissions.BasePermission):
+    """Members use a shopping list, only its owner changes it."""
+
+    def has_object_permission(self, request, view, obj):
+        return (view.action in view.member_actions
+                or obj.owner_id == request.user.id)
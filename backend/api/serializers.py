@@ -1,25 +1,96 @@
 from django.conf import settings
+from django.db import models
 from django.shortcuts import get_object_or_404
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_extra_fields.fields import Base64ImageField
+from jobs.models import Job
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+                            ShoppingCart, ShoppingList, ShoppingListItem, Tag)
+from recipes.shopping_lists import change_recipe_items
+from recipes.toggles import TOGGLE_MODELS
+from recipes.totals import change_totals
 from rest_framework import exceptions, serializers
+from rest_framework.reverse import reverse
 from rest_framework.validators import UniqueTogetherValidator
 from users.models import Follow, User
 
+from api.cards import (AUTHOR_CARD_FIELDS, get_author_cards, get_card,
+                       get_subscribed_ids)
+
+
+class SparseFieldsMixin:
+    """Keep the fields of the FieldSet passed in the context.
+
+    Requested relations that are not expanded use collapsed_fields.
+    """
+
+    collapsed_fields = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fieldset = self.context.get('fieldset')
+        if fieldset is None:
+            return
+        for name in list(self.fields):
+            if name not in fieldset:
+                self.fields.pop(name)
+            elif (
+                name in self.collapsed_fields
+                and not fieldset.is_expanded(name)
+            ):
+                field_class, field_kwargs = self.collapsed_fields[name]
+                self.fields[name] = field_class(**field_kwargs)
+
+
+class AuthorCardsListSerializer(serializers.ListSerializer):
+    """Load author cards and subscriptions of all rows at once."""
+
+    def to_representation(self, data):
+        if isinstance(data, models.manager.BaseManager):
+            data = data.all()
+        data = list(data)
+        author_ids = {
+            getattr(item, self.child.author_id_attr) for item in data
+        }
+        self.context['author_cards'] = get_author_cards(author_ids)
+        self.context['subscribed_ids'] = get_subscribed_ids(
+            self.context['request'].user, author_ids
+        )
+        return super().to_representation(data)
+
+
+class AuthorCardsMixin:
+    """Author fields from the profile card cache.
+
+    Lists use AuthorCardsListSerializer; single objects fetch their card.
+    """
+
+    author_id_attr = 'author_id'
+
+    def get_author_card(self, author_id, get_author):
+        card = self.context.get('author_cards', {}).get(author_id)
+        if card is None:
+            card = get_author_cards((author_id,)).get(author_id)
+        if card is None:
+            card = get_card(get_author())
+        return card
+
+    def is_subscribed_to(self, author_id):
+        if author_id in self.context.get('author_cards', {}):
+            return author_id in self.context['subscribed_ids']
+        return author_id in get_subscribed_ids(
+            self.context['request'].user, (author_id,)
+        )
 
-class UserSerializer(UserSerializer):
+
+class UserSerializer(AuthorCardsMixin, UserSerializer):
     """User serializer."""
 
     is_subscribed = serializers.SerializerMethodField()
+    author_id_attr = 'pk'
 
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        return (
-            user.is_authenticated and obj.subscribers.filter(
-                user=user).exists()
-        )
+        return self.is_subscribed_to(obj.pk)
 
     class Meta:
         model = User
@@ -31,6 +102,18 @@ class UserSerializer(UserSerializer):
             'last_name',
             'is_subscribed'
         )
+        list_serializer_class = AuthorCardsListSerializer
+
+    def to_representation(self, instance):
+        card = self.get_author_card(instance.pk, lambda: instance)
+        return {
+            field.field_name: (
+                card[field.field_name]
+                if field.field_name in AUTHOR_CARD_FIELDS
+                else field.to_representation(field.get_attribute(instance))
+            )
+            for field in self._readable_fields
+        }
 
 
 class UserCreateSerializer(UserCreateSerializer):
@@ -48,11 +131,17 @@ class UserCreateSerializer(UserCreateSerializer):
         )
 
 
-class UserWithRecipesSerializer(UserSerializer):
+class UserWithRecipesSerializer(SparseFieldsMixin, UserSerializer):
     """User recipes serializer."""
 
     recipes = serializers.SerializerMethodField()
     recipes_count = serializers.SerializerMethodField()
+    collapsed_fields = {
+        'recipes': (
+            serializers.SerializerMethodField,
+            {'method_name': 'get_recipe_ids'}
+        ),
+    }
 
     class Meta:
         model = User
@@ -66,6 +155,7 @@ class UserWithRecipesSerializer(UserSerializer):
             'recipes',
             'recipes_count'
         )
+        list_serializer_class = AuthorCardsListSerializer
 
     def get_recipes(self, obj):
         request = self.context.get('request')
@@ -82,8 +172,23 @@ class UserWithRecipesSerializer(UserSerializer):
 
         return serializer.data
 
+    def get_recipe_ids(self, obj):
+        recipes_limit = self.context.get('request').GET.get(
+            'recipes_limit', settings.RECIPES_LIMIT_DEFAULT
+        )
+        return list(
+            Recipe.objects.filter(author=obj).values_list(
+                'id', flat=True
+            )[:int(recipes_limit)]
+        )
+
+    def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_total'):
+            return obj.recipes_total
+        return obj.recipes.count()
 
-class FollowSerializer(UserSerializer):
+
+class FollowSerializer(serializers.ModelSerializer):
     """Follow user serializer."""
 
     class Meta:
@@ -144,14 +249,29 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit')
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(SparseFieldsMixin, AuthorCardsMixin,
+                       serializers.ModelSerializer):
     """Recipe Serializer."""
 
-    author = UserSerializer(read_only=True)
+    author = serializers.SerializerMethodField()
     tags = TagSerializer(many=True)
     ingredients = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    collapsed_fields = {
+        'author': (
+            serializers.PrimaryKeyRelatedField,
+            {'read_only': True}
+        ),
+        'tags': (
+            serializers.PrimaryKeyRelatedField,
+            {'read_only': True, 'many': True}
+        ),
+        'ingredients': (
+            serializers.SerializerMethodField,
+            {'method_name': 'get_ingredient_amounts'}
+        ),
+    }
 
     class Meta:
         model = Recipe
@@ -167,22 +287,40 @@ class RecipeSerializer(serializers.ModelSerializer):
             'text',
             'cooking_time',
         )
+        list_serializer_class = AuthorCardsListSerializer
+
+    def get_author(self, obj):
+        return {
+            **self.get_author_card(obj.author_id, lambda: obj.author),
+            'is_subscribed': self.is_subscribed_to(obj.author_id),
+        }
 
     def get_ingredients(self, obj):
-        ingredients = RecipeIngredient.objects.filter(recipe=obj)
+        ingredients = obj.recipe_ingredient.all()
         serializer = RecipeIngredientsSerializer(ingredients, many=True)
         return serializer.data
 
+    def get_ingredient_amounts(self, obj):
+        return [
+            {'id': ingredient.product_id, 'amount': ingredient.amount}
+            for ingredient in obj.recipe_ingredient.all()
+        ]
+
     def get_is_favorited(self, obj):
-        return self.get_is_add(obj, Favorite)
+        return self.get_is_add(obj, 'favorite', 'favorited')
 
     def get_is_in_shopping_cart(self, obj):
-        return self.get_is_add(obj, ShoppingCart)
-
-    def get_is_add(self, obj, add):
+        return self.get_is_add(obj, 'shopping_cart', 'in_shopping_cart')
+
+    def get_is_add(self, obj, kind, annotation):
+        toggled = self.context.get('toggles', {}).get((kind, obj.pk))
+        if toggled is not None:
+            return toggled
+        if hasattr(obj, annotation):
+            return getattr(obj, annotation)
         user = self.context['request'].user
         return (
-            user.is_authenticated and add.objects.filter(
+            user.is_authenticated and TOGGLE_MODELS[kind].objects.filter(
                 user=user, recipe=obj).exists()
         )
 
@@ -228,6 +366,10 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
             for ingredient in ingredients
         ]
         RecipeIngredient.objects.bulk_create(recipe_ingredients)
+        change_totals(
+            (recipe.pk, item.product_id, item.amount)
+            for item in recipe_ingredients
+        )
         return recipe
 
     def update(self, instance, validated_data):
@@ -236,23 +378,33 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
             instance.tags.set(tags)
 
         ingredients = validated_data.pop('ingredients', None)
+        # Saved first: save() writes the totals the instance was loaded with.
+        instance = super().update(instance, validated_data)
         if ingredients is not None:
             instance.ingredients.clear()
 
-        recipe_ingredients = [
-            RecipeIngredient(
-                recipe=instance,
-                product=get_object_or_404(Ingredient, pk=ingredient['id']),
-                amount=ingredient['amount']
-            )
-            for ingredient in ingredients
-        ]
+            recipe_ingredients = [
+                RecipeIngredient(
+                    recipe=instance,
+                    product=get_object_or_404(
+                        Ingredient, pk=ingredient['id']
+                    ),
+                    amount=ingredient['amount']
+                )
+                for ingredient in ingredients
+            ]
 
-        RecipeIngredient.objects.bulk_create(
-            recipe_ingredients, ignore_conflicts=True
-        )
+            RecipeIngredient.objects.bulk_create(
+                recipe_ingredients, ignore_conflicts=True
+            )
+            rows = [
+                (instance.pk, item.product_id, item.amount)
+                for item in recipe_ingredients
+            ]
+            change_totals(rows)
+            change_recipe_items(rows)
 
-        return super().update(instance, validated_data)
+        return instance
 
     def to_representation(self, instance):
         serializer = RecipeSerializer(
@@ -299,3 +451,53 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
                 message='Already on purchase list!'
             )
         ]
+
+
+class ShoppingListItemSerializer(serializers.ModelSerializer):
+    """ShoppingListItem Serializer."""
+
+    id = serializers.ReadOnlyField(source='product.id')
+    name = serializers.ReadOnlyField(source='product.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='product.measurement_unit'
+    )
+
+    class Meta:
+        model = ShoppingListItem
+        fields = ('id', 'name', 'measurement_unit', 'amount', 'checked')
+        read_only_fields = ('amount',)
+        extra_kwargs = {'checked': {'required': True}}
+
+
+class ShoppingListSerializer(serializers.ModelSerializer):
+    """ShoppingList Serializer."""
+
+    recipes = RecipeListSerializer(many=True, read_only=True)
+    items = ShoppingListItemSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = ShoppingList
+        fields = ('id', 'name', 'owner', 'members', 'recipes', 'items')
+        read_only_fields = ('owner', 'members')
+
+
+class JobSerializer(serializers.ModelSerializer):
+    """Job Serializer."""
+
+    download = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = (
+            'id', 'name', 'status', 'result', 'created_at', 'finished_at',
+            'download',
+        )
+
+    def get_download(self, obj):
+        if not obj.file:
+            return None
+        return reverse(
+            'jobs-download',
+            args=(obj.pk,),
+            request=self.context.get('request')
+        )
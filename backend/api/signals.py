@@ -0,0 +1,66 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from foodgram.softdelete import soft_deleted
+
+from api.authentication import forget_tokens
+from api.cards import forget_author_cards
+from api.conditional import (RECIPES_DELETED_KEY, USER_CHANGED_KEY,
+                             forget_changed_at)
+from recipes.models import Favorite, Recipe, ShoppingCart
+from recipes.toggles import toggles_flushed
+from users.models import Follow, User
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    forget_tokens((instance.key,))
+
+
+@receiver(soft_deleted, sender=User)
+def delete_user_tokens(sender, pks, **kwargs):
+    Token.objects.filter(user_id__in=pks).delete()
+
+
+@receiver(post_save, sender=User)
+def forget_user_tokens(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    forget_tokens(
+        Token.objects.filter(user=instance).values_list('key', flat=True)
+    )
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_user_card(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    forget_author_cards((instance.pk,))
+
+
+@receiver(soft_deleted, sender=User)
+def forget_deleted_user_cards(sender, pks, **kwargs):
+    forget_author_cards(pks)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def forget_user_changed_at(sender, instance, **kwargs):
+    forget_changed_at(USER_CHANGED_KEY.format(instance.user_id))
+
+
+@receiver(toggles_flushed)
+def forget_flushed_user_changed_at(sender, user_id, **kwargs):
+    forget_changed_at(USER_CHANGED_KEY.format(user_id))
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(soft_deleted, sender=Recipe)
+def forget_recipes_deleted_at(sender, **kwargs):
+    forget_changed_at(RECIPES_DELETED_KEY)
@@ -0,0 +1,9 @@
+from django.conf import settings
+from jobs.queue import periodic
+
+from api.downloads import prune_downloads
+
+
+@periodic('prune_downloads', settings.DOWNLOADS_PRUNE_INTERVAL)
+def prune_download_files():
+    prune_downloads(settings.DOWNLOADS_MAX_AGE)
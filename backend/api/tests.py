@@ -0,0 +1,303 @@
+import itertools
+import os
+import tempfile
+import time
+import warnings
+from unittest import mock, skipUnless
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache.backends.base import CacheKeyWarning
+from django.core.files.storage import default_storage
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+from django.urls import resolve
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+
+from api.downloads import prune_downloads, save_download
+from api.encoders import RecipeEncoder
+from api.fieldsets import RECIPE_FIELDS, RECIPE_RELATIONS, FieldSet
+from api.filters import RECIPE_ORDERINGS, RecipiesFilter
+from foodgram.db_router import (PrimaryReplicaRouter,
+                                ReplicaRoutingMiddleware, replica_alias)
+from recipes.catalog import Catalog
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, ShoppingList, Tag)
+from users.models import Follow, User
+
+RANGE_FILTERS = (
+    {},
+    {'cooking_time__gte': 10, 'cooking_time__lte': 20},
+    {'pub_date__gte': '2023-01-01T00:00:00Z'},
+)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Checks PostgreSQL plans.')
+class RecipeOrderingIndexTests(TestCase):
+    """Recipe orderings and range filters."""
+
+    def test_combinations_use_index_scan(self):
+        # Test tables are tiny; sequential scans are only taken when no
+        # index serves the query.
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        orderings = [None] + [value for value, _ in RECIPE_ORDERINGS]
+        for filters, ordering in itertools.product(RANGE_FILTERS, orderings):
+            data = dict(filters)
+            if ordering:
+                data['ordering'] = ordering
+            with self.subTest(**data):
+                filterset = RecipiesFilter(
+                    data,
+                    queryset=Recipe.objects.all(),
+                    request=Request(RequestFactory().get('/', data)),
+                )
+                self.assertTrue(filterset.is_valid(), filterset.errors)
+                plan = filterset.qs.values_list('pk', flat=True)[:6].explain()
+                self.assertNotIn('Seq Scan', plan)
+                self.assertIn('Index', plan)
+
+
+class RecipeFastPathTests(TestCase):
+    """RECIPE_FAST_PATH payloads against the serializer ones."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader, author = (
+            User.objects.create_user(
+                username=name, email=f'{name}@example.com', password='x',
+                first_name='Имя', last_name='Last',
+            )
+            for name in ('reader', 'author')
+        )
+        tags = [
+            Tag.objects.create(
+                name=f'Tag {index}', slug=f'tag{index}',
+                color=f'#00000{index}',
+            )
+            for index in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'ingredient {index % 3}',
+                measurement_unit='g' if index % 2 else 'kg',
+            )
+            for index in range(6)
+        ]
+        cls.recipes = []
+        for index in range(5):
+            recipe = Recipe.objects.create(
+                author=(author, cls.reader)[index % 2],
+                name=f'Recipe "{index}" ü',
+                text='Text',
+                cooking_time=index + 1,
+                image=f'recipes/images/{index}.png',
+            )
+            recipe.tags.set(tags[:index % 3 + 1])
+            for offset in range(index % 3 + 1):
+                RecipeIngredient.objects.create(
+                    recipe=recipe,
+                    product=ingredients[(index + offset) % 6],
+                    amount=offset + 1,
+                )
+            cls.recipes.append(recipe)
+        Follow.objects.create(user=cls.reader, author=author)
+        Favorite.objects.create(user=cls.reader, recipe=cls.recipes[0])
+        ShoppingCart.objects.create(user=cls.reader, recipe=cls.recipes[2])
+
+    def test_catalog_rows_of_deleted_authors_are_dropped(self):
+        catalog = Catalog().build()
+        User.objects.filter(pk=self.recipes[0].author_id).soft_delete()
+        request = Request(RequestFactory().get('/api/recipes/'))
+        request.user = AnonymousUser()
+        encoder = RecipeEncoder(
+            request, FieldSet(request, RECIPE_FIELDS, RECIPE_RELATIONS),
+            catalog,
+        )
+        self.assertEqual(
+            [recipe['id'] for recipe in encoder.encode(
+                [recipe.pk for recipe in self.recipes[:2]]
+            )],
+            [self.recipes[1].pk],
+        )
+
+    def get_payload(self, client, url, fast_path):
+        with override_settings(RECIPE_FAST_PATH=fast_path):
+            response = client.get(url, HTTP_ACCEPT='application/json')
+        return response.status_code, response.json()
+
+    def test_payloads_match_serializers(self):
+        detail = f'/api/recipes/{self.recipes[0].pk}/'
+        urls = (
+            '/api/recipes/',
+            '/api/recipes/?limit=2&page=2',
+            '/api/recipes/?tags=tag1&tags=tag2',
+            '/api/recipes/?is_favorited=1',
+            '/api/recipes/?is_in_shopping_cart=1',
+            '/api/recipes/?fields=id,name,author&expand=author',
+            '/api/recipes/?fields=tags,ingredients&expand=',
+            detail,
+            f'/api/recipes/{self.recipes[1].pk}/',
+            '/api/recipes/0/',
+        )
+        client = APIClient()
+        for user in (None, self.reader):
+            client.force_authenticate(user)
+            for url in urls:
+                with self.subTest(url=url, user=user):
+                    self.assertEqual(
+                        self.get_payload(client, url, fast_path=True),
+                        self.get_payload(client, url, fast_path=False),
+                    )
+        client.force_authenticate(self.reader)
+        status, data = self.get_payload(client, detail, fast_path=True)
+        self.assertEqual(status, 200)
+        self.assertTrue(data['is_favorited'])
+        self.assertTrue(data['author']['is_subscribed'])
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(SimpleTestCase):
+    """Replica reads of safe API requests."""
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.token = replica_alias.set(None)
+        self.addCleanup(replica_alias.reset, self.token)
+
+    def route(self, method, path):
+        """Alias chosen for the request reads by the middleware."""
+        request = getattr(RequestFactory(), method)(path)
+        middleware = ReplicaRoutingMiddleware(lambda request: None)
+        middleware.process_view(request, resolve(path).func, (), {})
+        return self.router.db_for_read(Recipe)
+
+    def test_safe_api_requests_read_from_replica(self):
+        for path in ('/api/recipes/', '/api/recipes/1/', '/api/tags/'):
+            with self.subTest(path=path):
+                replica_alias.set(None)
+                self.assertEqual(self.route('get', path), 'replica')
+
+    def test_other_requests_read_from_primary(self):
+        for method, path in (
+            ('post', '/api/recipes/'),
+            ('delete', '/api/recipes/1/'),
+            ('get', '/api/recipes/download_shopping_cart/'),
+            ('get', '/api/shopping_lists/'),
+            ('get', '/api/jobs/1/'),
+            ('get', '/admin/'),
+        ):
+            with self.subTest(method=method, path=path):
+                replica_alias.set(None)
+                self.assertEqual(self.route(method, path), DEFAULT_DB_ALIAS)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas(self):
+        self.assertEqual(self.route('get', '/api/recipes/'), DEFAULT_DB_ALIAS)
+
+    def test_write_pins_request_to_primary(self):
+        replica_alias.set('replica')
+        self.assertEqual(self.router.db_for_write(Recipe), DEFAULT_DB_ALIAS)
+        self.assertEqual(self.router.db_for_read(Recipe), DEFAULT_DB_ALIAS)
+
+    def test_atomic_block_reads_from_primary(self):
+        replica_alias.set('replica')
+        with mock.patch.object(
+            connections[DEFAULT_DB_ALIAS], 'in_atomic_block', True
+        ):
+            self.assertEqual(
+                self.router.db_for_read(Recipe), DEFAULT_DB_ALIAS
+            )
+        self.assertEqual(self.router.db_for_read(Recipe), 'replica')
+
+    def test_alias_is_reset_after_request(self):
+        def get_response(request):
+            replica_alias.set('replica')
+            return self.router.db_for_read(Recipe)
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        self.assertEqual(
+            middleware(RequestFactory().get('/api/recipes/')), 'replica'
+        )
+        self.assertIsNone(replica_alias.get())
+
+    def test_only_migrates_primary(self):
+        self.assertTrue(self.router.allow_migrate(DEFAULT_DB_ALIAS, 'recipes'))
+        self.assertFalse(self.router.allow_migrate('replica', 'recipes'))
+
+
+class SingleFlightKeyTests(TestCase):
+    """Cache keys of requests shared with single_flight."""
+
+    def test_keys_are_memcached_safe(self):
+        user = User.objects.create_user(
+            username='user', email='user@example.com', password='x'
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', CacheKeyWarning)
+            for url in (
+                '/api/ingredients/?name=red onion',
+                '/api/recipes/download_shopping_cart/',
+            ):
+                with self.subTest(url=url):
+                    self.assertEqual(client.get(url).status_code, 200)
+
+
+class DownloadTests(TestCase):
+    """Text downloads sent through nginx."""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        accel = override_settings(
+            MEDIA_ROOT=media.name, USE_X_ACCEL_REDIRECT=True
+        )
+        accel.enable()
+        self.addCleanup(accel.disable)
+        self.owner, self.outsider = (
+            User.objects.create_user(
+                username=name, email=f'{name}@example.com', password='x'
+            )
+            for name in ('owner', 'outsider')
+        )
+        self.client = APIClient()
+
+    def test_downloads_are_private_media(self):
+        shopping_list = ShoppingList.objects.create(
+            name='Party', owner=self.owner
+        )
+        shopping_list.members.add(self.owner)
+        self.client.force_authenticate(self.owner)
+        for url, directory in (
+            (f'/api/shopping_lists/{shopping_list.pk}/download/',
+             'shared_shopping_lists'),
+            ('/api/recipes/download_shopping_cart/', 'shopping_lists'),
+        ):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response['X-Accel-Redirect'].startswith(
+                    f'/media/private/{directory}/'
+                ))
+        self.client.force_authenticate(self.outsider)
+        response = self.client.get(
+            f'/api/shopping_lists/{shopping_list.pk}/download/'
+        )
+        self.assertNotIn('X-Accel-Redirect', response)
+
+    def test_unused_downloads_are_pruned(self):
+        old, reused, fresh = (
+            save_download('shopping_lists', text).split('/media/', 1)[1]
+            for text in ('old', 'reused', 'fresh')
+        )
+        day_ago = time.time() - 86400
+        for name in (old, reused):
+            os.utime(default_storage.path(name), (day_ago, day_ago))
+        save_download('shopping_lists', 'reused')
+        self.assertEqual(prune_downloads(3600), 1)
+        self.assertFalse(default_storage.exists(old))
+        self.assertTrue(default_storage.exists(reused))
+        self.assertTrue(default_storage.exists(fresh))
@@ -0,0 +1,86 @@
+import time
+from threading import Lock
+
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Refills the bucket for the time passed and takes a token, atomically.
+TAKE_TOKEN_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local refill = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(now - updated, 0) * refill)
+local allowed = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+end
+redis.call(
+  'HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now)
+)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / refill) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+lock = Lock()
+
+
+def take_token(key, capacity, refill):
+    """Take a token from the bucket at key; return (allowed, tokens left)."""
+    cache = caches['default']
+    if isinstance(cache, RedisCache):
+        key = cache.make_and_validate_key(key)
+        allowed, tokens = cache._cache.get_client(key, write=True).eval(
+            TAKE_TOKEN_SCRIPT, 1, key, capacity, refill
+        )
+        return bool(allowed), float(tokens)
+    # Other backends have no atomic update, which is fine for one process.
+    with lock:
+        now = time.time()
+        tokens, updated = cache.get(key, (capacity, now))
+        tokens = min(capacity, tokens + max(now - updated, 0) * refill)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        cache.set(key, (tokens, now), int(capacity / refill) + 1)
+    return allowed, tokens
+
+
+class ScopedTokenBucketThrottle(BaseThrottle):
+    """Token bucket per user, or address, and view throttle_scope.
+
+    A rate of N/period allows bursts of N requests and refills N tokens
+    evenly over the period.
+    """
+
+    cache_format = 'throttle:{scope}:{ident}'
+    THROTTLE_RATES = api_settings.DEFAULT_THROTTLE_RATES
+
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        rate = self.THROTTLE_RATES.get(scope)
+        if rate is None:
+            return True
+        number, period = rate.split('/')
+        self.capacity = int(number)
+        self.refill = self.capacity / DURATIONS[period[0]]
+        ident = request.user.pk
+        if not request.user.is_authenticated:
+            ident = self.get_ident(request)
+        allowed, self.tokens = take_token(
+            self.cache_format.format(scope=scope, ident=ident),
+            self.capacity,
+            self.refill,
+        )
+        return allowed
+
+    def wait(self):
+        return (1 - self.tokens) / self.refill
@@ -1,26 +1,53 @@
+from django.conf import settings
 from django.db import models
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.functional import cached_property
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
-from rest_framework import exceptions, status, viewsets
+from jobs.models import Job
+from jobs.queue import enqueue
+from jobs.views import job_file_response
+from rest_framework import exceptions, mixins, status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import (IsAuthenticated,
+from rest_framework.permissions import (IsAdminUser, IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from foodgram.cache import single_flight
 from foodgram.pagination import CustomPagination
+from recipes.catalog import get_catalog
+from recipes.export import EXPORT_FORMATS
+from recipes.feed import get_feed
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+                            ShoppingCart, ShoppingList, ShoppingListItem,
+                            ShoppingListRecipe, SimilarRecipe, Tag)
+from recipes.shopping_lists import (add_recipe, get_shopping_list_text,
+                                    remove_recipes)
+from recipes.tasks import get_purchase_list
+from recipes.toggles import flush, get_buffer, is_write_behind, toggle
 from users.models import Follow, User
 
+from api.conditional import (USER_CHANGED_KEY, conditional_recipes,
+                             forget_changed_at, get_changed_at)
+from api.downloads import text_download_response
+from api.encoders import RecipeEncoder
+from api.fieldsets import (RECIPE_FIELDS, RECIPE_RELATIONS,
+                           SUBSCRIPTION_FIELDS, SUBSCRIPTION_RELATIONS,
+                           FieldSet)
 from api.filters import IngredientFilter, RecipiesFilter
-from api.permissions import RecipePermission
+from api.permissions import RecipePermission, ShoppingListPermission
+from api.renderers import ORJSONRenderer
 from api.serializers import (FavoriteSerializer, FollowSerializer,
-                             IngredientSerializer,
+                             IngredientSerializer, JobSerializer,
                              RecipeCreateUpdateSerializer,
                              RecipeListSerializer, RecipeSerializer,
-                             ShoppingCartSerializer, TagSerializer,
+                             ShoppingCartSerializer,
+                             ShoppingListItemSerializer,
+                             ShoppingListSerializer, TagSerializer,
                              UserCreateSerializer, UserWithRecipesSerializer)
+from api.throttles import ScopedTokenBucketThrottle
 
 
 class UserViewSet(UserViewSet):
@@ -36,13 +63,27 @@ class UserViewSet(UserViewSet):
         permission_classes=(IsAuthenticated, )
     )
     def subscriptions(self, request):
+        fieldset = FieldSet(
+            request, SUBSCRIPTION_FIELDS, SUBSCRIPTION_RELATIONS
+        )
         queryset = User.objects.filter(subscribers__user=request.user)
+        if 'recipes_count' in fieldset:
+            queryset = queryset.annotate(recipes_total=models.Count(
+                'recipes', filter=models.Q(recipes__deleted_at__isnull=True)
+            ))
         paginated_queryset = self.paginate_queryset(queryset)
-        serializer = self.get_serializer(paginated_queryset, many=True)
+        serializer = self.get_serializer(
+            paginated_queryset,
+            many=True,
+            context={**self.get_serializer_context(), 'fieldset': fieldset}
+        )
         return self.get_paginated_response(serializer.data)
 
     action_serializer = UserCreateSerializer
 
+    def perform_destroy(self, instance):
+        User.objects.filter(pk=instance.pk).soft_delete()
+
     @action(
         detail=True,
         methods=('POST', 'DELETE'),
@@ -81,12 +122,140 @@ class RecipeViewSet(viewsets.ModelViewSet):
     pagination_class = CustomPagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipiesFilter
+    read_from_replica = True
+    read_actions = ('list', 'retrieve', 'feed')
+    throttle_scope = None
+
+    @cached_property
+    def fieldset(self):
+        return FieldSet(self.request, RECIPE_FIELDS, RECIPE_RELATIONS)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in self.read_actions:
+            return queryset
+        fieldset = self.fieldset
+        if 'tags' in fieldset:
+            queryset = queryset.prefetch_related('tags')
+        if 'ingredients' in fieldset:
+            ingredients = RecipeIngredient.objects.all()
+            if fieldset.is_expanded('ingredients'):
+                ingredients = ingredients.select_related('product')
+            queryset = queryset.prefetch_related(
+                models.Prefetch('recipe_ingredient', queryset=ingredients)
+            )
+        user = self.request.user
+        if user.is_authenticated and 'is_favorited' in fieldset:
+            queryset = queryset.annotate(favorited=models.Exists(
+                Favorite.objects.filter(
+                    user=user, recipe=models.OuterRef('pk')
+                )
+            ))
+        if user.is_authenticated and 'is_in_shopping_cart' in fieldset:
+            queryset = queryset.annotate(in_shopping_cart=models.Exists(
+                ShoppingCart.objects.filter(
+                    user=user, recipe=models.OuterRef('pk')
+                )
+            ))
+        return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action in self.read_actions:
+            context['fieldset'] = self.fieldset
+            context['toggles'] = get_buffer(self.request.user)
+        return context
 
     def get_serializer_class(self):
         if self.action in ('create', 'partial_update'):
             return RecipeCreateUpdateSerializer
         return RecipeSerializer
 
+    @cached_property
+    def catalog(self):
+        """Catalog snapshot, when it alone can answer the request."""
+        if self.action != 'retrieve' or (
+            self.request.query_params.keys()
+            & self.filterset_class.base_filters.keys()
+        ):
+            return None
+        return get_catalog()
+
+    def get_renderers(self):
+        renderers = super().get_renderers()
+        if not settings.RECIPE_FAST_PATH:
+            return renderers
+        return [
+            ORJSONRenderer() if type(renderer) is JSONRenderer else renderer
+            for renderer in renderers
+        ]
+
+    @conditional_recipes
+    def list(self, request, *args, **kwargs):
+        if not settings.RECIPE_FAST_PATH:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(
+            queryset.values_list('pk', flat=True)
+        )
+        encoder = RecipeEncoder(request, self.fieldset)
+        if page is not None:
+            return self.get_paginated_response(encoder.encode(page))
+        return Response(
+            encoder.encode(queryset.values_list('pk', flat=True))
+        )
+
+    @conditional_recipes
+    def retrieve(self, request, *args, **kwargs):
+        if self.catalog is not None:
+            try:
+                recipe_ids = [int(self.kwargs['pk'])]
+            except ValueError:
+                raise Http404
+            data = RecipeEncoder(request, self.fieldset, self.catalog).encode(
+                recipe_ids
+            )
+            if not data:
+                raise Http404
+            return Response(data[0])
+        if not settings.RECIPE_FAST_PATH:
+            return super().retrieve(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        try:
+            recipe_ids = queryset.filter(
+                pk=self.kwargs['pk']
+            ).values_list('pk', flat=True)[:1]
+        except (TypeError, ValueError):
+            raise Http404
+        data = RecipeEncoder(request, self.fieldset).encode(recipe_ids)
+        if not data:
+            raise Http404
+        return Response(data[0])
+
+    def perform_destroy(self, instance):
+        # Dependents are removed by the purge_deleted job.
+        Recipe.objects.filter(pk=instance.pk).soft_delete()
+
+    def buffered_toggle(self, request, recipe, kind, added, missing):
+        """Answer a favorite or cart toggle kept in the write-behind buffer.
+
+        Errors match the synchronous path; the state checked is the
+        stored one with the buffered toggles applied.
+        """
+        adding = request.method == 'POST'
+        if not toggle(request.user, kind, recipe.pk, adding):
+            raise exceptions.ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: [added]} if adding
+                else missing
+            )
+        forget_changed_at(USER_CHANGED_KEY.format(request.user.pk))
+        if adding:
+            return Response(
+                RecipeListSerializer(recipe).data,
+                status=status.HTTP_201_CREATED
+            )
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
     def favorite_logic(self, user, recipe):
         serializer = FavoriteSerializer(
             data={'user': user.id, 'recipe': recipe.id}
@@ -100,6 +269,12 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def favorite(self, request, pk=None):
         user = self.request.user
         recipe = get_object_or_404(Recipe, pk=pk)
+        if is_write_behind():
+            return self.buffered_toggle(
+                request, recipe, 'favorite',
+                'Already on favorites list!',
+                'The recipe is not in list of favorites!'
+            )
         if self.request.method == 'POST':
             favorite_data = self.favorite_logic(user, recipe)
             return Response(
@@ -127,6 +302,12 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def shopping_cart(self, request, pk=None):
         user = self.request.user
         recipe = get_object_or_404(Recipe, pk=pk)
+        if is_write_behind():
+            return self.buffered_toggle(
+                request, recipe, 'shopping_cart',
+                'Already on purchase list!',
+                'The recipe is not in list of shopping_cart!'
+            )
         if self.request.method == 'POST':
             shopping_cart_data = self.shopping_cart_logic(user, recipe)
             return Response(
@@ -141,30 +322,213 @@ class RecipeViewSet(viewsets.ModelViewSet):
         shopping_cart.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=True, methods=('GET',))
+    def similar(self, request, pk=None):
+        recipe = self.get_object()
+        neighbors = SimilarRecipe.objects.filter(
+            recipe=recipe, similar__deleted_at__isnull=True
+        ).select_related('similar').order_by('-score')
+        serializer = RecipeListSerializer(
+            [neighbor.similar for neighbor in neighbors],
+            many=True,
+            context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+
     @action(
         detail=False,
         methods=('GET',),
         permission_classes=(IsAuthenticated,)
     )
+    def feed(self, request):
+        page = self.paginate_queryset(get_feed(request.user))
+        recipe_ids = [recipe_id for recipe_id, _ in page]
+        if settings.RECIPE_FAST_PATH:
+            data = RecipeEncoder(request, self.fieldset).encode(recipe_ids)
+        else:
+            recipes = self.get_queryset().in_bulk(recipe_ids)
+            serializer = self.get_serializer(
+                [recipes[pk] for pk in recipe_ids if pk in recipes],
+                many=True
+            )
+            data = serializer.data
+        return self.get_paginated_response(data)
+
+    @action(
+        detail=False,
+        methods=('GET', 'POST'),
+        permission_classes=(IsAuthenticated,),
+        throttle_classes=(ScopedTokenBucketThrottle,),
+        throttle_scope='downloads',
+        read_from_replica=False
+    )
     def download_shopping_cart(self, request):
-        shopping_cart = ShoppingCart.objects.filter(user=self.request.user)
-        recipes = [item.recipe.id for item in shopping_cart]
-        ingredients = (
-            RecipeIngredient.objects.filter(recipe_id__in=recipes)
-            .values("product_id__name", "product_id__measurement_unit")
-            .annotate(models.Sum("amount"))
+        if is_write_behind():
+            flush(request.user.pk)
+        if request.method == 'POST':
+            job = enqueue('shopping_list', user=request.user)
+            serializer = JobSerializer(job, context={'request': request})
+            return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+        # Repeated clicks share one query; a cart change starts a new one.
+        purchase_list_text = single_flight(
+            'purchase_list:{}:{}'.format(
+                request.user.pk,
+                get_changed_at(USER_CHANGED_KEY.format(request.user.pk))
+            ),
+            lambda: get_purchase_list(request.user)
         )
-        purchase_list_text = 'Purchase list:\n\n'
-        for item in ingredients:
-            purchase_list_text += (
-                f'{item["product_id__name"]}, {item["amount__sum"]} '
-                f'{item["product_id__measurement_unit"]}\n'
-            )
-        response = HttpResponse(purchase_list_text, content_type='text/plain')
-        response['content-disposition'] = (
-            'attachment; filename=purchase_list.txt'
+        return text_download_response('shopping_lists', purchase_list_text)
+
+    @action(
+        detail=False,
+        methods=('POST',),
+        permission_classes=(IsAdminUser,)
+    )
+    def export(self, request):
+        """Queue an export of all recipes; the job links to the file."""
+        export_format = request.data.get('export_format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            raise exceptions.ValidationError({
+                'export_format': f'Choose one of {", ".join(EXPORT_FORMATS)}.'
+            })
+        try:
+            after = int(request.data.get('after', 0))
+        except (TypeError, ValueError):
+            raise exceptions.ValidationError({'after': 'Must be an integer.'})
+        job = enqueue(
+            'export_recipes',
+            user=request.user,
+            export_format=export_format,
+            after=after,
         )
-        return response
+        serializer = JobSerializer(job, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+
+class ShoppingListViewSet(viewsets.ModelViewSet):
+    """Shared ShoppingList ViewSet."""
+
+    serializer_class = ShoppingListSerializer
+    permission_classes = (IsAuthenticated, ShoppingListPermission)
+    pagination_class = CustomPagination
+    read_from_replica = False
+    member_actions = ('retrieve', 'recipe', 'member', 'download')
+
+    def get_queryset(self):
+        queryset = ShoppingList.objects.filter(members=self.request.user)
+        if self.action in ('list', 'retrieve', 'member'):
+            queryset = queryset.prefetch_related(
+                'members',
+                'recipes',
+                models.Prefetch(
+                    'items',
+                    queryset=ShoppingListItem.objects.filter(
+                        amount__gt=0
+                    ).select_related('product')
+                ),
+            )
+        return queryset
+
+    def perform_create(self, serializer):
+        shopping_list = serializer.save(owner=self.request.user)
+        shopping_list.members.add(self.request.user)
+
+    @action(
+        detail=True,
+        methods=('POST', 'DELETE'),
+        url_path=r'recipes/(?P<recipe_id>\d+)'
+    )
+    def recipe(self, request, pk=None, recipe_id=None):
+        shopping_list = self.get_object()
+        recipe = get_object_or_404(Recipe, pk=recipe_id)
+        if request.method == 'POST':
+            if not add_recipe(shopping_list, recipe):
+                raise exceptions.ValidationError(
+                    'The recipe is already in the shopping list!'
+                )
+            return Response(
+                RecipeListSerializer(recipe).data,
+                status=status.HTTP_201_CREATED
+            )
+        if not remove_recipes(ShoppingListRecipe.objects.filter(
+            shopping_list=shopping_list, recipe=recipe
+        )):
+            raise exceptions.ValidationError(
+                'The recipe is not in the shopping list!'
+            )
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(
+        detail=True,
+        methods=('PATCH',),
+        url_path=r'items/(?P<product_id>\d+)'
+    )
+    def item(self, request, pk=None, product_id=None):
+        serializer = ShoppingListItemSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        # One indexed UPDATE, membership included; totals stay untouched.
+        updated = ShoppingListItem.objects.filter(
+            shopping_list_id=pk,
+            shopping_list__members=request.user,
+            product_id=product_id,
+        ).update(checked=serializer.validated_data['checked'])
+        if not updated:
+            raise Http404
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(
+        detail=True,
+        methods=('POST', 'DELETE'),
+        url_path=r'members/(?P<user_id>\d+)'
+    )
+    def member(self, request, pk=None, user_id=None):
+        shopping_list = self.get_object()
+        user = get_object_or_404(User, pk=user_id)
+        # Members may only leave; the owner manages the rest.
+        if shopping_list.owner_id != request.user.id and (
+            request.method == 'POST' or user != request.user
+        ):
+            self.permission_denied(request)
+        if request.method == 'POST':
+            if user in shopping_list.members.all():
+                raise exceptions.ValidationError('Already a member!')
+            shopping_list.members.add(user)
+            return Response(
+                self.get_serializer(self.get_object()).data,
+                status=status.HTTP_201_CREATED
+            )
+        if user.pk == shopping_list.owner_id:
+            raise exceptions.ValidationError(
+                'The owner cannot leave the shopping list!'
+            )
+        if user not in shopping_list.members.all():
+            raise exceptions.ValidationError('Not a member!')
+        shopping_list.members.remove(user)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=('GET',))
+    def download(self, request, pk=None):
+        return text_download_response(
+            'shared_shopping_lists',
+            get_shopping_list_text(self.get_object())
+        )
+
+
+class JobViewSet(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """Job status ViewSet."""
+
+    serializer_class = JobSerializer
+    permission_classes = (IsAuthenticated,)
+    read_from_replica = False
+
+    def get_queryset(self):
+        if self.request.user.is_staff:
+            return Job.objects.all()
+        return Job.objects.filter(user=self.request.user)
+
+    @action(detail=True, methods=('GET',))
+    def download(self, request, pk=None):
+        return job_file_response(self.get_object())
 
 
 class IngredientViewSet(viewsets.ModelViewSet):
@@ -176,6 +540,18 @@ class IngredientViewSet(viewsets.ModelViewSet):
     pagination_class = None
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
+    throttle_classes = (ScopedTokenBucketThrottle,)
+    throttle_scope = 'ingredients'
+
+    def list(self, request, *args, **kwargs):
+        # Searches run per keystroke; the same prefix is queried once.
+        name = request.query_params.get('name', '').lower()
+        return Response(single_flight(
+            f'ingredients:{name}',
+            lambda: super(IngredientViewSet, self).list(
+                request, *args, **kwargs
+            ).data
+        ))
 
 
 class TagViewSet(viewsets.ModelViewSet):
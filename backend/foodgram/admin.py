@@ -0,0 +1,110 @@
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin import autodiscover
+from django.contrib.admin.views.main import PAGE_VAR
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils.functional import cached_property
+
+from foodgram.softdelete import AliveManager
+
+
+class LazyAdminURLconf:
+    """Admin URLconf that discovers the admin modules on first use."""
+
+    @cached_property
+    def urlpatterns(self):
+        autodiscover()
+        return admin.site.get_urls()
+
+
+def count_subquery(queryset, field):
+    """Number of queryset rows whose field points at the outer row.
+
+    Unlike a grouped join, it is only computed for the rows of the page.
+    """
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by()
+        .values(field).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+class SoftDeleteAdminMixin:
+    """Soft-delete instead of collecting the cascade in the request."""
+
+    def delete_model(self, request, obj):
+        self.model.objects.filter(pk=obj.pk).soft_delete()
+
+    def delete_queryset(self, request, queryset):
+        queryset.soft_delete()
+
+    def get_deleted_objects(self, objs, request):
+        objs = list(objs)
+        return (
+            [str(obj) for obj in objs],
+            {self.model._meta.verbose_name_plural: len(objs)},
+            set(),
+            [],
+        )
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator taking unfiltered table sizes from pg_class statistics.
+
+    Exact counts of big tables are a sequential scan on every changelist.
+    The soft-delete filter of AliveManager does not count as a filter:
+    the few soft-deleted rows are counted on their partial index and
+    subtracted from the estimate.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        model = queryset.model
+        connection = connections[queryset.db]
+        manager = model._default_manager
+        alive = isinstance(manager, AliveManager)
+        where = queryset.query.where
+        unfiltered = not where or (
+            alive and where == manager.all().query.where
+        )
+        if connection.vendor == 'postgresql' and unfiltered:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                    (model._meta.db_table,)
+                )
+                row = cursor.fetchone()
+            if row and row[0] > settings.ADMIN_ESTIMATED_COUNT_MIN:
+                if not alive:
+                    return int(row[0])
+                deleted = model._base_manager.using(queryset.db).filter(
+                    deleted_at__isnull=False
+                ).count()
+                return max(int(row[0]) - deleted, 0)
+        return super().count
+
+
+class InputFilter(admin.SimpleListFilter):
+    """List filter with a text box instead of a link per value."""
+
+    template = 'admin/input_filter.html'
+    lookup = None
+
+    def lookups(self, request, model_admin):
+        return ((None, None),)
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.lookup: self.value()})
+        return queryset
+
+    def choices(self, changelist):
+        all_choice = next(super().choices(changelist))
+        all_choice['query_parts'] = [
+            (name, value) for name, value in changelist.params.items()
+            if name not in (self.parameter_name, PAGE_VAR)
+        ]
+        yield all_choice
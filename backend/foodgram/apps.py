@@ -0,0 +1,11 @@
+from django.conf import settings
+from django.contrib.admin.apps import SimpleAdminConfig
+
+
+class AdminConfig(SimpleAdminConfig):
+    """Admin app that may leave autodiscovery to the admin URLconf."""
+
+    def ready(self):
+        super().ready()
+        if not settings.ADMIN_LAZY_DISCOVERY:
+            self.module.autodiscover()
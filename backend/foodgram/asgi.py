@@ -13,4 +13,13 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from api.events import EVENTS_PATH, recipe_events  # noqa: E402
+
+
+async def application(scope, receive, send):
+    """Django, with the recipe event stream served next to it."""
+    if scope['type'] == 'http' and scope['path'] == EVENTS_PATH:
+        return await recipe_events(scope, receive, send)
+    return await django_application(scope, receive, send)
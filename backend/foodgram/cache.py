@@ -0,0 +1,94 @@
+import time
+from collections import OrderedDict
+from hashlib import sha1
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+
+SINGLE_FLIGHT_KEY = 'single_flight:{}'
+MISSING = object()
+PROCESS_CACHE_BACKENDS = (
+    'django.core.cache.backends.dummy.DummyCache',
+    'django.core.cache.backends.locmem.LocMemCache',
+)
+
+
+def is_shared_cache():
+    """Whether the default cache is shared by all processes."""
+    return settings.CACHES['default']['BACKEND'] not in PROCESS_CACHE_BACKENDS
+
+
+class LRUCache:
+    """Bounded in-process LRU cache with a per-entry TTL."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                return default
+            expires, value = item
+            if expires < time.monotonic():
+                del self.data[key]
+                return default
+            self.data.move_to_end(key)
+            return value
+
+    def get_many(self, keys):
+        found = {}
+        for key in keys:
+            value = self.get(key, self)
+            if value is not self:
+                found[key] = value
+        return found
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = (time.monotonic() + self.ttl, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+def single_flight(key, compute):
+    """Share one call of compute() between identical concurrent requests.
+
+    The first caller takes a lock in the shared cache and publishes the
+    result for SINGLE_FLIGHT_RESULT_TTL; the others, in any worker, wait
+    for it instead of repeating the work. A lock left by a dead worker
+    expires after SINGLE_FLIGHT_TIMEOUT. key may hold any text; it is
+    hashed into a memcached-safe cache key.
+    """
+    result_key = SINGLE_FLIGHT_KEY.format(sha1(key.encode()).hexdigest())
+    lock_key = f'{result_key}:lock'
+    deadline = time.monotonic() + settings.SINGLE_FLIGHT_TIMEOUT
+    while True:
+        result = cache.get(result_key, MISSING)
+        if result is not MISSING:
+            return result
+        if cache.add(lock_key, True, settings.SINGLE_FLIGHT_TIMEOUT):
+            try:
+                result = compute()
+                cache.set(
+                    result_key, result, settings.SINGLE_FLIGHT_RESULT_TTL
+                )
+            finally:
+                cache.delete(lock_key)
+            return result
+        if time.monotonic() > deadline:
+            return compute()
+        time.sleep(settings.SINGLE_FLIGHT_POLL_INTERVAL)
@@ -0,0 +1,68 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+replica_alias = ContextVar('replica_alias', default=None)
+
+
+def read_from_replica(view_func):
+    """Whether the view may read from a replica.
+
+    Views opt out with a read_from_replica = False attribute, actions
+    with @action(read_from_replica=False).
+    """
+    initkwargs = getattr(view_func, 'initkwargs', {})
+    if 'read_from_replica' in initkwargs:
+        return initkwargs['read_from_replica']
+    view = getattr(view_func, 'cls', view_func)
+    return getattr(view, 'read_from_replica', True)
+
+
+class PrimaryReplicaRouter:
+    """Send reads of safe API requests to a replica and the rest to primary.
+
+    A write pins the rest of the request to the primary, so users always
+    read their own writes.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = replica_alias.get()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        replica_alias.set(None)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaRoutingMiddleware:
+    """Choose the database for the request reads."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = replica_alias.set(None)
+        try:
+            return self.get_response(request)
+        finally:
+            replica_alias.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            settings.DATABASE_REPLICAS
+            and request.method in SAFE_METHODS
+            and request.path.startswith(settings.REPLICA_PATH_PREFIXES)
+            and read_from_replica(view_func)
+        ):
+            replica_alias.set(random.choice(settings.DATABASE_REPLICAS))
@@ -2,13 +2,56 @@ import os
 from datetime import timedelta
 from pathlib import Path
 
-from dotenv import load_dotenv
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+# Containers get their environment from compose; only local runs read
+# the .env file from the repository root.
+ENV_FILE = os.getenv('ENV_FILE', BASE_DIR.parent / '.env')
+if os.path.exists(ENV_FILE):
+    from dotenv import load_dotenv
 
-load_dotenv()
+    load_dotenv(ENV_FILE)
 
 RECIPES_LIMIT_DEFAULT = 10
 
-BASE_DIR = Path(__file__).resolve().parent.parent
+RECIPE_FAST_PATH = os.getenv('RECIPE_FAST_PATH', default='').lower() == 'true'
+
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', 5000))
+FEED_BATCH_SIZE = int(os.getenv('FEED_BATCH_SIZE', 1000))
+FEED_BACKFILL_SIZE = int(os.getenv('FEED_BACKFILL_SIZE', 50))
+FEED_POPULAR_AUTHORS_TIMEOUT = 60
+
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 2000))
+LOAD_BATCH_SIZE = int(os.getenv('LOAD_BATCH_SIZE', 1000))
+LOAD_IMAGE_WORKERS = int(os.getenv('LOAD_IMAGE_WORKERS', 4))
+
+SIMILAR_RECIPES_COUNT = int(os.getenv('SIMILAR_RECIPES_COUNT', 20))
+SIMILAR_RECIPES_BLOCK_SIZE = 1000
+
+TOTALS_BATCH_SIZE = int(os.getenv('TOTALS_BATCH_SIZE', 5000))
+
+# Ingredient names with this trigram Jaccard similarity are checked as
+# duplicates, allowing one typo per DEDUP_CHARS_PER_EDIT characters.
+DEDUP_THRESHOLD = float(os.getenv('DEDUP_THRESHOLD', 0.5))
+DEDUP_CHARS_PER_EDIT = int(os.getenv('DEDUP_CHARS_PER_EDIT', 12))
+DEDUP_BATCH_SIZE = int(os.getenv('DEDUP_BATCH_SIZE', 1000))
+DEDUP_BLOCK_SIZE = 2000
+
+PURGE_BATCH_SIZE = int(os.getenv('PURGE_BATCH_SIZE', 1000))
+
+JOBS_WORKERS = int(os.getenv('JOBS_WORKERS', 2))
+JOBS_POLL_INTERVAL = float(os.getenv('JOBS_POLL_INTERVAL', 1))
+# run_jobs refreshes the heartbeat of its running jobs every
+# JOBS_HEARTBEAT_INTERVAL seconds; jobs without one for JOBS_TIMEOUT
+# seconds are treated as lost with their worker.
+JOBS_HEARTBEAT_INTERVAL = int(os.getenv('JOBS_HEARTBEAT_INTERVAL', 30))
+JOBS_TIMEOUT = int(os.getenv('JOBS_TIMEOUT', 300))
+JOBS_MAX_ATTEMPTS = int(os.getenv('JOBS_MAX_ATTEMPTS', 3))
+
+# Web workers import the admin modules on the first admin request.
+ADMIN_LAZY_DISCOVERY = (
+    os.getenv('ADMIN_LAZY_DISCOVERY', default='').lower() == 'true'
+)
 
 SECRET_KEY = os.getenv('SECRET_KEY')
 
@@ -24,7 +67,7 @@ CSRF_TRUSTED_ORIGINS = [
 ]
 
 INSTALLED_APPS = [
-    'django.contrib.admin',
+    'foodgram.apps.AdminConfig',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -33,6 +76,7 @@ INSTALLED_APPS = [
     'recipes',
     'users',
     'api',
+    'jobs',
     'rest_framework',
     'rest_framework.authtoken',
     'django_filters',
@@ -42,6 +86,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'foodgram.db_router.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -72,6 +117,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
 
+# Transaction-pooling pgbouncer cannot keep server-side cursors alive
+# between transactions.
+DB_PGBOUNCER = os.getenv('DB_PGBOUNCER', default='').lower() == 'true'
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -79,10 +128,44 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', 'foodgram'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', ''),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'PORT': os.getenv('DB_PORT', 5432),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': os.getenv(
+            'DB_CONN_HEALTH_CHECKS', default='true'
+        ).lower() == 'true',
+        'DISABLE_SERVER_SIDE_CURSORS': DB_PGBOUNCER,
     }
 }
 
+# Comma-separated replica hosts; safe-method API reads are spread over them.
+for number, host in enumerate(
+    filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), start=1
+):
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+
+DATABASE_ROUTERS = ['foodgram.db_router.PrimaryReplicaRouter']
+
+REPLICA_PATH_PREFIXES = ('/api/',)
+
+
+# Shared cache for all workers, e.g. CACHE_LOCATION=redis://cache:6379/0.
+# Token caching and conditional GET of recipes are off without it.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+if os.getenv('CACHE_LOCATION'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('CACHE_LOCATION'),
+    }
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -113,8 +196,22 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Let nginx send generated downloads from MEDIA_ROOT via X-Accel-Redirect.
+USE_X_ACCEL_REDIRECT = os.getenv(
+    'USE_X_ACCEL_REDIRECT', default=''
+).lower() == 'true'
+# Downloads and job files go under this MEDIA_ROOT directory, which
+# nginx serves only through X-Accel-Redirect.
+PRIVATE_MEDIA_DIR = 'private'
+# run_jobs deletes text downloads unused for DOWNLOADS_MAX_AGE seconds.
+DOWNLOADS_MAX_AGE = int(os.getenv('DOWNLOADS_MAX_AGE', 24 * 3600))
+DOWNLOADS_PRUNE_INTERVAL = 3600
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Admin lists of tables bigger than this show the pg_class row estimate.
+ADMIN_ESTIMATED_COUNT_MIN = int(os.getenv('ADMIN_ESTIMATED_COUNT_MIN', 10000))
+
 AUTH_USER_MODEL = 'users.User'
 
 REST_FRAMEWORK = {
@@ -123,11 +220,62 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'foodgram.pagination.CustomPagination',
+    # Proxies appending to X-Forwarded-For, the gateway nginx by default;
+    # the client address is the one the outermost of them added.
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', 1)),
+    'DEFAULT_THROTTLE_RATES': {
+        'ingredients': os.getenv('THROTTLE_RATE_INGREDIENTS', '120/min'),
+        'downloads': os.getenv('THROTTLE_RATE_DOWNLOADS', '10/min'),
+    },
 }
 
+# Identical concurrent requests wait up to SINGLE_FLIGHT_TIMEOUT seconds
+# for the one being computed and reuse its result for a short while.
+SINGLE_FLIGHT_TIMEOUT = 10
+SINGLE_FLIGHT_RESULT_TTL = 2
+SINGLE_FLIGHT_POLL_INTERVAL = 0.05
+
+TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', 300))
+TOKEN_CACHE_LOCAL_TTL = int(os.getenv('TOKEN_CACHE_LOCAL_TTL', 10))
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 10000))
+
+AUTHOR_CARD_TTL = int(os.getenv('AUTHOR_CARD_TTL', 300))
+AUTHOR_CARD_LOCAL_TTL = int(os.getenv('AUTHOR_CARD_LOCAL_TTL', 10))
+AUTHOR_CARD_CACHE_SIZE = int(os.getenv('AUTHOR_CARD_CACHE_SIZE', 10000))
+
+# Favorite and shopping cart toggles are kept in the cache and written by
+# run_jobs every TOGGLES_FLUSH_INTERVAL seconds, in one transaction per
+# user. It needs the Redis cache (CACHE_LOCATION); without it toggles are
+# written right away.
+TOGGLES_WRITE_BEHIND = (
+    os.getenv('TOGGLES_WRITE_BEHIND', default='').lower() == 'true'
+)
+TOGGLES_FLUSH_INTERVAL = float(os.getenv('TOGGLES_FLUSH_INTERVAL', 2))
+TOGGLES_TIMEOUT = 86400
+TOGGLES_LOCK_TIMEOUT = 5
+TOGGLES_LOCK_POLL_INTERVAL = 0.01
+
+# Web workers keep a snapshot of recipes, tags and ingredients for recipe
+# details and tag filters, refreshed from the CatalogChange log. Changes
+# are re-read for CATALOG_CHANGE_SETTLE seconds in case their transaction
+# commits late, and kept for CATALOG_CHANGE_RETENTION seconds.
+CATALOG_SNAPSHOT = os.getenv('CATALOG_SNAPSHOT', default='').lower() == 'true'
+CATALOG_REFRESH_INTERVAL = float(os.getenv('CATALOG_REFRESH_INTERVAL', 1))
+CATALOG_CHANGE_SETTLE = 60
+CATALOG_CHANGE_RETENTION = 86400
+# Tag filters use snapshot ids only when they match at most this many.
+CATALOG_FILTER_MAX_IDS = 1000
+
+# Server-sent events of new recipes, served by the ASGI app (uvicorn).
+EVENTS_HEARTBEAT_INTERVAL = int(os.getenv('EVENTS_HEARTBEAT_INTERVAL', 15))
+EVENTS_RETRY = 5
+EVENTS_BACKLOG_SIZE = 100
+EVENTS_QUEUE_SIZE = 100
+EVENTS_RECONNECT_DELAY = 1
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=100),
     'AUTH_HEADER_TYPES': ('Bearer',),
@@ -0,0 +1,73 @@
+from django.db import models
+from django.dispatch import Signal
+from django.utils import timezone
+
+# Sent with sender=model and pks of the rows just soft-deleted.
+soft_deleted = Signal()
+
+
+class SoftDeleteQuerySet(models.QuerySet):
+    """QuerySet of models with a deleted_at column."""
+
+    def soft_delete(self):
+        """Hide the rows with one UPDATE; purge deletes them later."""
+        pks = list(self.values_list('pk', flat=True))
+        count = self.model._base_manager.filter(
+            pk__in=pks, deleted_at__isnull=True
+        ).update(deleted_at=timezone.now())
+        if pks:
+            soft_deleted.send(sender=self.model, pks=pks)
+        return count
+
+
+class AliveManager(models.Manager.from_queryset(SoftDeleteQuerySet)):
+    """Manager of rows that are not soft-deleted."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
+def get_dependents(model):
+    """(model, foreign key) pairs of the rows referencing model rows."""
+    return [
+        (relation.related_model, relation.field)
+        for relation in model._meta.get_fields(include_hidden=True)
+        if relation.auto_created and not relation.concrete
+        and (relation.one_to_many or relation.one_to_one)
+    ]
+
+
+def delete_in_batches(queryset, batch_size):
+    """Delete queryset rows batch_size at a time with plain DELETEs.
+
+    Objects are not loaded and no signals are sent; rows below them go
+    with the database ON DELETE CASCADE. Counters kept up by signals of
+    the deleted rows are left to the caller to recount.
+    """
+    deleted = 0
+    while True:
+        pks = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return deleted
+        rows = queryset.model._base_manager.filter(pk__in=pks)
+        # Django's fast delete path; QuerySet.delete() would load every
+        # row to send its signals.
+        deleted += rows._raw_delete(rows.db)
+
+
+def purge(model, batch_size):
+    """Delete soft-deleted rows of model, their dependents first.
+
+    Each DELETE touches at most batch_size rows, so locks are short and
+    nothing is collected in memory. Returns the number of model rows.
+    No signals are sent, see delete_in_batches.
+    """
+    deleted = model._base_manager.filter(deleted_at__isnull=False)
+    for related_model, field in get_dependents(model):
+        delete_in_batches(
+            related_model._base_manager.filter(
+                **{f'{field.name}__in': deleted.values('pk')}
+            ),
+            batch_size,
+        )
+    return delete_in_batches(deleted, batch_size)
@@ -3,8 +3,10 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from foodgram.admin import LazyAdminURLconf
+
 urlpatterns = [
-    path('admin/', admin.site.urls),
+    path('admin/', (LazyAdminURLconf(), 'admin', admin.site.name)),
     path('api/', include('api.urls')),
 ]
 
@@ -0,0 +1,74 @@
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+
+# Capped by default: every worker keeps its own database connections, so
+# big hosts would otherwise open more than PostgreSQL allows.
+workers = int(
+    os.getenv('GUNICORN_WORKERS', min(multiprocessing.cpu_count() * 2 + 1, 8))
+)
+
+# More than one thread switches gunicorn to the gthread worker; every
+# thread keeps its own persistent database connection.
+threads = int(os.getenv('GUNICORN_THREADS', 1))
+
+# Connections the web service may open on each database, primary and
+# replicas alike: at most one per worker thread. Keep it below
+# max_connections minus the job runner, events and admin sessions.
+db_connections = int(os.getenv('GUNICORN_DB_CONNECTIONS', 80))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 2))
+
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 0))
+
+# The master imports the app once and forks workers sharing its memory.
+preload_app = os.getenv('GUNICORN_PRELOAD', default='true').lower() == 'true'
+
+# Workers import the admin and import-export modules only when the admin
+# is used.
+os.environ.setdefault('ADMIN_LAZY_DISCOVERY', 'true')
+
+
+def on_starting(server):
+    """Refuse to start more worker threads than db_connections."""
+    needed = server.cfg.workers * server.cfg.threads
+    if needed > db_connections:
+        raise SystemExit(
+            f'{server.cfg.workers} workers x {server.cfg.threads} threads '
+            f'need {needed} database connections, more than '
+            f'GUNICORN_DB_CONNECTIONS={db_connections}.'
+        )
+
+
+def pre_fork(server, worker):
+    """Close connections the preloaded app opened in the master.
+
+    Otherwise every worker inherits the same database sockets.
+    """
+    if server.cfg.preload_app:
+        from django.db import connections
+
+        connections.close_all()
+
+
+def load_catalog():
+    from django.db import connections
+    from recipes.catalog import get_catalog
+
+    get_catalog()
+    connections.close_all()
+
+
+def when_ready(server):
+    """Build the catalog snapshot once; forked workers share its pages."""
+    if server.cfg.preload_app:
+        load_catalog()
+
+
+def post_worker_init(worker):
+    """Build or catch up the catalog snapshot before taking requests."""
+    load_catalog()
@@ -0,0 +1,52 @@
+from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+
+from jobs.models import Job
+from jobs.views import job_file_response
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    """JobAdmin class."""
+
+    list_display = (
+        'id', 'name', 'user', 'status', 'attempts', 'created_at',
+        'finished_at', 'download',
+    )
+    list_filter = ('status', 'name',)
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    readonly_fields = (
+        'attempts', 'result', 'error', 'created_at', 'started_at',
+        'finished_at', 'download',
+    )
+    exclude = ('file',)
+    empty_value_display = '-filter-'
+
+    def get_urls(self):
+        return [
+            path(
+                '<int:pk>/download/',
+                self.admin_site.admin_view(self.download_view),
+                name='jobs_job_download',
+            ),
+        ] + super().get_urls()
+
+    def download_view(self, request, pk):
+        job = get_object_or_404(Job, pk=pk)
+        if not self.has_view_permission(request, job):
+            raise PermissionDenied
+        return job_file_response(job)
+
+    @admin.display(description='Result file')
+    def download(self, obj):
+        if not obj.file:
+            return None
+        return format_html(
+            '<a href="{}">{}</a>',
+            reverse('admin:jobs_job_download', args=(obj.pk,)),
+            obj.file.name.rsplit('/', 1)[-1],
+        )
@@ -0,0 +1,79 @@
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from jobs.queue import (claim_jobs, requeue_stale, run_job, run_periodic,
+                        send_heartbeats)
+from jobs.workers import setup_worker
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs in a process pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.JOBS_WORKERS
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit when the queue is empty.',
+        )
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        workers = options['workers']
+        # Futures of the running jobs and their (id, attempts) leases.
+        running = {}
+        last_runs = {}
+        last_heartbeat = time.monotonic()
+        # Workers are spawned with their own database connections.
+        connections.close_all()
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=get_context('spawn'),
+            initializer=setup_worker,
+        )
+        self.stdout.write(f"Running jobs with {workers} workers.")
+        with pool:
+            while not self.stopping:
+                requeue_stale()
+                run_periodic(last_runs)
+                if (
+                    time.monotonic() - last_heartbeat
+                    >= settings.JOBS_HEARTBEAT_INTERVAL
+                ):
+                    send_heartbeats(running.values())
+                    last_heartbeat = time.monotonic()
+                if len(running) < workers:
+                    for lease in claim_jobs(workers - len(running)):
+                        running[pool.submit(run_job, *lease)] = lease
+                if running:
+                    self.collect(running, settings.JOBS_POLL_INTERVAL)
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(settings.JOBS_POLL_INTERVAL)
+            if running:
+                self.stdout.write("Waiting for running jobs.")
+            while running:
+                self.collect(running, settings.JOBS_HEARTBEAT_INTERVAL)
+                send_heartbeats(running.values())
+        self.stdout.write("Stopped.")
+
+    def collect(self, running, timeout):
+        """Wait up to timeout for running jobs and drop the finished ones."""
+        done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            del running[future]
+            future.result()
+
+    def stop(self, signum, frame):
+        self.stopping = True
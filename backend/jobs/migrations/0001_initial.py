@@ -0,0 +1,41 @@
+# Generated by Django 4.2.3 on 2026-10-19 10:45
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import jobs.models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, verbose_name='Task')),
+                ('params', models.JSONField(blank=True, default=dict, verbose_name='Parameters')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=16, verbose_name='Status')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Attempts')),
+                ('result', models.JSONField(blank=True, null=True, verbose_name='Result')),
+                ('file', models.FileField(blank=True, upload_to=jobs.models.job_file_path, verbose_name='Result file')),
+                ('error', models.TextField(blank=True, verbose_name='Error')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Creation Date')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Start Date')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Finish Date')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Job',
+                'verbose_name_plural': 'Jobs',
+                'ordering': ('-created_at',),
+                'indexes': [models.Index(condition=models.Q(('status__in', ('queued', 'running'))), fields=['status', 'created_at'], name='job_pending_idx')],
+            },
+        ),
+    ]
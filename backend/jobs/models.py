@@ -0,0 +1,99 @@
+from django.conf import settings
+from django.db import models
+
+from users.models import User
+
+
+def job_file_path(job, filename):
+    return f'{settings.PRIVATE_MEDIA_DIR}/jobs/{job.pk}/{filename}'
+
+
+class Job(models.Model):
+    """Background job."""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    name = models.CharField(
+        max_length=64,
+        verbose_name='Task',
+    )
+    params = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name='Parameters',
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='jobs',
+        verbose_name='User',
+    )
+    status = models.CharField(
+        max_length=16,
+        choices=STATUSES,
+        default=QUEUED,
+        verbose_name='Status',
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name='Attempts',
+    )
+    result = models.JSONField(
+        null=True,
+        blank=True,
+        verbose_name='Result',
+    )
+    file = models.FileField(
+        upload_to=job_file_path,
+        blank=True,
+        verbose_name='Result file',
+    )
+    error = models.TextField(
+        blank=True,
+        verbose_name='Error',
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Creation Date',
+    )
+    started_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Start Date',
+    )
+    heartbeat_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Heartbeat Date',
+    )
+    finished_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Finish Date',
+    )
+
+    class Meta:
+        ordering = ('-created_at',)
+        verbose_name = 'Job'
+        verbose_name_plural = 'Jobs'
+        indexes = (
+            models.Index(
+                fields=('status', 'created_at'),
+                condition=models.Q(status__in=('queued', 'running')),
+                name='job_pending_idx'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.name} #{self.pk} ({self.status})'
@@ -0,0 +1,161 @@
+import logging
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, models, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from jobs.models import Job
+
+tasks = {}
+periodic_tasks = {}
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseLost(Exception):
+    """The job was given to another worker while this one ran it."""
+
+
+def task(name):
+    """Register func as the task run for jobs called name."""
+
+    def decorator(func):
+        tasks[name] = func
+        return func
+
+    return decorator
+
+
+def periodic(name, interval):
+    """Register func to be called by run_jobs every interval seconds."""
+
+    def decorator(func):
+        periodic_tasks[name] = (func, interval)
+        return func
+
+    return decorator
+
+
+def enqueue(name, user=None, **params):
+    if name not in tasks:
+        raise ValueError(f'Unknown task: {name}.')
+    return Job.objects.create(name=name, user=user, params=params)
+
+
+def claim_jobs(limit):
+    """Mark up to limit queued jobs as running.
+
+    Returns (id, attempts) pairs; the attempt number is the lease of the
+    worker on the job. Locked rows are skipped, so any number of workers
+    can poll the table.
+    """
+    with transaction.atomic():
+        job_ids = list(
+            Job.objects.select_for_update(skip_locked=True).filter(
+                status=Job.QUEUED
+            ).order_by('created_at').values_list('pk', flat=True)[:limit]
+        )
+        now = timezone.now()
+        Job.objects.filter(pk__in=job_ids).update(
+            status=Job.RUNNING,
+            started_at=now,
+            heartbeat_at=now,
+            attempts=models.F('attempts') + 1,
+        )
+        return list(
+            Job.objects.filter(pk__in=job_ids).order_by(
+                'created_at'
+            ).values_list('pk', 'attempts')
+        )
+
+
+def get_leased(leases):
+    """Running jobs of the (id, attempts) leases."""
+    query = Q(pk__in=())
+    for job_id, attempts in leases:
+        query |= Q(pk=job_id, attempts=attempts)
+    return Job.objects.filter(query, status=Job.RUNNING)
+
+
+def send_heartbeats(leases):
+    """Mark the jobs of the (id, attempts) leases as still running."""
+    return get_leased(leases).update(heartbeat_at=timezone.now())
+
+
+def check_lease(job):
+    """Raise LeaseLost unless this attempt of job still runs it.
+
+    Tasks call it before they replace their output.
+    """
+    if not get_leased([(job.pk, job.attempts)]).exists():
+        raise LeaseLost(f'Job #{job.pk} attempt {job.attempts} was requeued.')
+
+
+def requeue_stale():
+    """Return jobs of crashed workers to the queue or give up on them.
+
+    A job is lost when its worker sent no heartbeat for JOBS_TIMEOUT.
+    """
+    expired = timezone.now() - timedelta(seconds=settings.JOBS_TIMEOUT)
+    stale = Job.objects.filter(
+        Q(heartbeat_at__lt=expired)
+        | Q(heartbeat_at__isnull=True, started_at__lt=expired),
+        status=Job.RUNNING,
+    )
+    stale.filter(attempts__lt=settings.JOBS_MAX_ATTEMPTS).update(
+        status=Job.QUEUED
+    )
+    stale.update(
+        status=Job.FAILED, error='Timed out.', finished_at=timezone.now()
+    )
+
+
+def run_job(job_id, attempts):
+    """Run attempt number attempts of a claimed job.
+
+    Called in the worker processes. The outcome is only saved while the
+    attempt holds the job, so a requeued job is finished by one worker.
+    """
+    close_old_connections()
+    try:
+        job = get_leased([(job_id, attempts)]).select_related('user').first()
+        if job is None:
+            return
+        try:
+            job.result = tasks[job.name](job, **job.params)
+        except LeaseLost:
+            return
+        except Exception:
+            job.status = Job.FAILED
+            job.error = traceback.format_exc()
+        else:
+            job.status = Job.DONE
+        get_leased([(job_id, attempts)]).update(
+            status=job.status,
+            result=job.result,
+            file=job.file.name,
+            error=job.error,
+            finished_at=timezone.now(),
+        )
+    finally:
+        close_old_connections()
+
+
+def run_periodic(last_runs):
+    """Call the periodic tasks that are due in the run_jobs process.
+
+    last_runs maps task names to the time.monotonic() of their last call.
+    """
+    now = time.monotonic()
+    for name, (func, interval) in periodic_tasks.items():
+        if now - last_runs.get(name, -interval) < interval:
+            continue
+        last_runs[name] = now
+        try:
+            func()
+        except Exception:
+            logger.exception('Periodic task %s failed', name)
@@ -0,0 +1,55 @@
+from datetime import timedelta
+
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from jobs.models import Job
+from jobs.queue import (claim_jobs, enqueue, requeue_stale, run_job,
+                        send_heartbeats, task)
+
+
+@task('record_attempt')
+def record_attempt(job):
+    return {'attempt': job.attempts}
+
+
+@override_settings(JOBS_TIMEOUT=60, JOBS_MAX_ATTEMPTS=3)
+class RequeueTests(TestCase):
+    """Running jobs are requeued by heartbeat, not by age."""
+
+    def setUp(self):
+        enqueue('record_attempt')
+        (self.lease,) = claim_jobs(1)
+        self.long_ago = timezone.now() - timedelta(hours=1)
+
+    def test_slow_job_with_heartbeat_keeps_running(self):
+        Job.objects.update(started_at=self.long_ago)
+        self.assertEqual(send_heartbeats([self.lease]), 1)
+        requeue_stale()
+        self.assertEqual(Job.objects.get().status, Job.RUNNING)
+
+    def test_job_without_heartbeat_is_requeued(self):
+        Job.objects.update(
+            started_at=self.long_ago, heartbeat_at=self.long_ago
+        )
+        requeue_stale()
+        self.assertEqual(Job.objects.get().status, Job.QUEUED)
+        self.assertEqual(claim_jobs(1), [(self.lease[0], 2)])
+        self.assertEqual(send_heartbeats([self.lease]), 0)
+
+
+class RunJobTests(TransactionTestCase):
+    """run_job, which closes the connections it inherits."""
+
+    def test_requeued_attempt_is_not_saved(self):
+        enqueue('record_attempt')
+        (job_id, attempts), = claim_jobs(1)
+        Job.objects.update(status=Job.QUEUED)
+        (lease,) = claim_jobs(1)
+        run_job(job_id, attempts)
+        self.assertEqual(Job.objects.get().status, Job.RUNNING)
+        run_job(*lease)
+        job = Job.objects.get()
+        self.assertEqual(
+            (job.status, job.result), (Job.DONE, {'attempt': 2})
+        )
@@ -0,0 +1,23 @@
+import mimetypes
+import os
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+
+
+def job_file_response(job):
+    """Send the job result file, through nginx when it serves media."""
+    if not job.file:
+        raise Http404
+    filename = os.path.basename(job.file.name)
+    if settings.USE_X_ACCEL_REDIRECT:
+        response = HttpResponse(
+            content_type=mimetypes.guess_type(filename)[0]
+            or 'application/octet-stream'
+        )
+        response['X-Accel-Redirect'] = job.file.url
+        response['Content-Disposition'] = (
+            f'attachment; filename="{filename}"'
+        )
+        return response
+    return FileResponse(job.file.open('rb'), as_attachment=True)
@@ -0,0 +1,9 @@
+import signal
+
+import django
+
+
+def setup_worker():
+    """Prepare a spawned job process; the parent handles Ctrl+C."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    django.setup()
@@ -1,29 +1,66 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import SEARCH_VAR
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponseRedirect
+from django.urls import reverse
+from django.utils.decorators import method_decorator
+from django.utils.html import format_html
+from django.views.decorators.http import require_POST
 from import_export import resources
 from import_export.admin import ImportExportModelAdmin
+from foodgram.admin import (EstimatedCountPaginator, InputFilter,
+                            SoftDeleteAdminMixin)
+from import_export.tmp_storages import MediaStorage
+from jobs.queue import enqueue
 
 from .models import Favorite, Ingredient, Recipe, Tag
 
 
+def get_class_path(cls):
+    return f'{cls.__module__}.{cls.__qualname__}'
+
+
 class RecipeIngredientsInLine(admin.TabularInline):
     """RecipeIngredients embedded edition class."""
 
     model = Recipe.ingredients.through
     extra = 1
     min_num = 1
+    raw_id_fields = ('product',)
+
+
+class AuthorFilter(InputFilter):
+    """Recipe author username filter."""
+
+    title = 'author'
+    parameter_name = 'author'
+    lookup = 'author__username'
+
+
+class UserFilter(InputFilter):
+    """Username filter."""
+
+    title = 'user'
+    parameter_name = 'user'
+    lookup = 'user__username'
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(SoftDeleteAdminMixin, admin.ModelAdmin):
     """RecipeAdmin class."""
 
-    list_display = ('name', 'author', 'favorite_count',)
-    list_filter = ('author', 'name', 'tags',)
+    list_display = (
+        'name', 'author', 'favorites_count', 'calories', 'cost',
+    )
+    list_filter = (AuthorFilter, 'tags',)
+    readonly_fields = ('favorites_count', 'calories', 'cost',)
+    list_select_related = ('author',)
+    search_fields = ('name',)
+    raw_id_fields = ('author',)
     empty_value_display = '-filter-'
     inlines = (RecipeIngredientsInLine,)
-
-    def favorite_count(self, obj):
-        return obj.favorites.count()
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 class IngredientResource(resources.ModelResource):
@@ -37,11 +74,80 @@ class IngredientResource(resources.ModelResource):
 class IngredientAdmin(ImportExportModelAdmin):
     """IngredientAdmin class."""
 
-    list_display = ('name', 'measurement_unit',)
+    list_display = ('name', 'measurement_unit', 'calories', 'price',)
     search_fields = ('name',)
     empty_value_display = '-filter-'
     resource_class = IngredientResource
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    # Uploaded files are imported by the job worker, not this process.
+    tmp_storage_class = MediaStorage
+
+    def export_action(self, request, *args, **kwargs):
+        if not self.has_export_permission(request):
+            raise PermissionDenied
+        formats = self.get_export_formats()
+        form = self.get_export_form_class()(
+            formats,
+            request.POST or None,
+            resources=self.get_export_resource_classes()
+        )
+        if not form.is_valid():
+            return super().export_action(request, *args, **kwargs)
+        file_format = formats[int(form.cleaned_data['file_format'])]
+        job = enqueue(
+            'export_ingredients',
+            user=request.user,
+            file_format=get_class_path(file_format),
+            search=request.GET.get(SEARCH_VAR, ''),
+        )
+        return self.job_queued(request, job)
+
+    @method_decorator(require_POST)
+    def process_import(self, request, *args, **kwargs):
+        if not self.has_import_permission(request):
+            raise PermissionDenied
+        confirm_form = self.create_confirm_form(request)
+        if not confirm_form.is_valid():
+            return HttpResponseRedirect(
+                reverse('admin:recipes_ingredient_import')
+            )
+        input_format = self.get_import_formats()[
+            int(confirm_form.cleaned_data['input_format'])
+        ]
+        job = enqueue(
+            'import_ingredients',
+            user=request.user,
+            input_format=get_class_path(input_format),
+            import_file_name=confirm_form.cleaned_data['import_file_name'],
+            encoding=(
+                None if input_format().is_binary() else self.from_encoding
+            ),
+        )
+        return self.job_queued(request, job)
+
+    def job_queued(self, request, job):
+        messages.info(request, format_html(
+            'Queued as <a href="{}">job {}</a>.',
+            reverse('admin:jobs_job_change', args=(job.pk,)),
+            job.pk,
+        ))
+        return HttpResponseRedirect(
+            reverse('admin:recipes_ingredient_changelist')
+        )
+
+
+@admin.register(Favorite)
+class FavoriteAdmin(admin.ModelAdmin):
+    """FavoriteAdmin class."""
+
+    list_display = ('user', 'recipe', 'add_date',)
+    list_filter = (UserFilter,)
+    list_select_related = ('user', 'recipe',)
+    raw_id_fields = ('user', 'recipe',)
+    empty_value_display = '-filter-'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
-admin.site.register(Favorite)
 admin.site.register(Tag)
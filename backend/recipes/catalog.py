@@ -0,0 +1,336 @@
+import time
+from array import array
+from collections import defaultdict
+from datetime import timedelta
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from jobs.queue import enqueue
+
+from recipes.models import (CatalogChange, Ingredient, Recipe,
+                            RecipeIngredient, Tag)
+
+CATALOG_PRUNE_KEY = 'catalog:prune'
+RECIPE_COLUMNS = (
+    'id', 'author_id', 'name', 'image', 'text', 'cooking_time', 'updated_at'
+)
+TAG_COLUMNS = ('id', 'name', 'color', 'slug')
+INGREDIENT_COLUMNS = ('id', 'name', 'measurement_unit')
+
+lock = Lock()
+snapshot = None
+
+
+def log_changes(kind, object_ids):
+    """Append object_ids of kind to the change log of the snapshots."""
+    if not settings.CATALOG_SNAPSHOT:
+        return
+    CatalogChange.objects.bulk_create(
+        CatalogChange(kind=kind, object_id=pk) for pk in object_ids
+    )
+    transaction.on_commit(schedule_prune)
+
+
+def schedule_prune():
+    if cache.add(
+        CATALOG_PRUNE_KEY, True, settings.CATALOG_CHANGE_RETENTION // 2
+    ):
+        enqueue('prune_catalog_changes')
+
+
+def prune_changes():
+    """Delete change log rows every snapshot has read."""
+    return CatalogChange.objects.filter(
+        created_at__lt=timezone.now() - timedelta(
+            seconds=settings.CATALOG_CHANGE_RETENTION
+        )
+    ).delete()[0]
+
+
+class RecipeEntry:
+    """Recipe row with its tag ids and (product id, amount) pairs."""
+
+    __slots__ = RECIPE_COLUMNS + ('tag_ids', 'ingredients')
+
+    def __init__(self, *values):
+        for name, value in zip(RECIPE_COLUMNS, values):
+            setattr(self, name, value)
+        self.tag_ids = array('q')
+        self.ingredients = array('q')
+
+
+class TagEntry:
+    __slots__ = TAG_COLUMNS
+
+    def __init__(self, *values):
+        for name, value in zip(TAG_COLUMNS, values):
+            setattr(self, name, value)
+
+
+class IngredientEntry:
+    __slots__ = INGREDIENT_COLUMNS
+
+    def __init__(self, *values):
+        for name, value in zip(INGREDIENT_COLUMNS, values):
+            setattr(self, name, value)
+
+
+class Catalog:
+    """Read model of the recipes, tags and ingredients of the site.
+
+    Built with a few bulk queries and brought up to date from the
+    CatalogChange log; recipe entries are replaced whole, so readers in
+    other threads see either the old or the new one.
+    """
+
+    def __init__(self):
+        self.recipes = {}
+        self.tags = {}
+        self.tag_order = {}
+        self.ingredients = {}
+        self.tagged = defaultdict(set)
+        # Changes up to cursor are applied; later ones may still be
+        # missing rows of transactions that commit late, so they are read
+        # again and the ones in seen skipped.
+        self.cursor = 0
+        self.seen = set()
+        self.refreshed_at = time.monotonic()
+
+    def build(self):
+        self.cursor = self.get_settled_cursor()
+        self.load_tags(None)
+        self.load_ingredients(None)
+        self.load_recipes(None)
+        return self
+
+    def get_settled_cursor(self):
+        return CatalogChange.objects.filter(
+            created_at__lt=timezone.now() - timedelta(
+                seconds=settings.CATALOG_CHANGE_SETTLE
+            )
+        ).aggregate(cursor=Max('pk'))['cursor'] or 0
+
+    def refresh(self):
+        """Apply the changes logged after cursor."""
+        cursor = self.get_settled_cursor()
+        changes = defaultdict(set)
+        for pk, kind, object_id in CatalogChange.objects.filter(
+            pk__gt=self.cursor
+        ).values_list('pk', 'kind', 'object_id'):
+            if pk not in self.seen:
+                self.seen.add(pk)
+                changes[kind].add(object_id)
+        # Deleting a tag deletes its recipe rows without signals.
+        for tag_id in self.load_tags(changes[CatalogChange.TAG]):
+            changes[CatalogChange.RECIPE].update(self.tagged.get(tag_id, ()))
+        self.load_ingredients(changes[CatalogChange.INGREDIENT])
+        self.load_recipes(changes[CatalogChange.RECIPE])
+        self.cursor = max(cursor, self.cursor)
+        self.seen = {pk for pk in self.seen if pk > self.cursor}
+        self.refreshed_at = time.monotonic()
+
+    def load_tags(self, tag_ids):
+        """Load the tags, all of them when tag_ids is None.
+
+        Returns the ids of the tags that no longer exist.
+        """
+        tags = Tag.objects.all()
+        if tag_ids is not None:
+            if not tag_ids:
+                return set()
+            tags = tags.filter(pk__in=tag_ids)
+        loaded = {
+            row[0]: TagEntry(*row) for row in tags.values_list(*TAG_COLUMNS)
+        }
+        deleted = set(tag_ids or ()) - loaded.keys()
+        for pk in deleted:
+            self.tags.pop(pk, None)
+        self.tags.update(loaded)
+        self.tag_order = {
+            pk: position
+            for position, pk in enumerate(
+                Tag.objects.values_list('pk', flat=True)
+            )
+        }
+        return deleted
+
+    def load_ingredients(self, ingredient_ids):
+        ingredients = Ingredient.objects.all()
+        if ingredient_ids is not None:
+            if not ingredient_ids:
+                return
+            ingredients = ingredients.filter(pk__in=ingredient_ids)
+        loaded = {
+            row[0]: IngredientEntry(*row)
+            for row in ingredients.order_by().values_list(
+                *INGREDIENT_COLUMNS
+            )
+        }
+        for pk in ingredient_ids or ():
+            if pk not in loaded:
+                self.ingredients.pop(pk, None)
+        self.ingredients.update(loaded)
+
+    def load_recipes(self, recipe_ids):
+        """Load the recipes, all of them when recipe_ids is None.
+
+        Tags and ingredients created without a change of their own are
+        loaded along with the recipes using them.
+        """
+        recipes = Recipe.objects.all()
+        if recipe_ids is not None:
+            if not recipe_ids:
+                return
+            recipes = recipes.filter(pk__in=recipe_ids)
+        loaded = {
+            row[0]: RecipeEntry(*row)
+            for row in recipes.order_by().values_list(*RECIPE_COLUMNS)
+        }
+        selected = {'recipe_id__in': recipes.order_by().values('pk')}
+        for recipe_id, tag_id in Recipe.tags.through.objects.filter(
+            **selected
+        ).order_by('recipe_id', 'tag_id').values_list('recipe_id', 'tag_id'):
+            # Recipes created after the first query are left out.
+            if recipe_id in loaded:
+                loaded[recipe_id].tag_ids.append(tag_id)
+        for recipe_id, product_id, amount in RecipeIngredient.objects.filter(
+            **selected
+        ).order_by('recipe_id', 'product_id').values_list(
+            'recipe_id', 'product_id', 'amount'
+        ):
+            if recipe_id in loaded:
+                loaded[recipe_id].ingredients.extend((product_id, amount))
+        self.load_tags({
+            tag_id for entry in loaded.values() for tag_id in entry.tag_ids
+        } - self.tags.keys())
+        self.load_ingredients({
+            product_id
+            for entry in loaded.values()
+            for product_id in entry.ingredients[::2]
+        } - self.ingredients.keys())
+        for pk in recipe_ids if recipe_ids is not None else loaded:
+            old, new = self.recipes.get(pk), loaded.get(pk)
+            old_tags = set(old.tag_ids) if old else set()
+            new_tags = set(new.tag_ids) if new else set()
+            for tag_id in new_tags - old_tags:
+                self.tagged[tag_id].add(pk)
+            for tag_id in old_tags - new_tags:
+                self.tagged[tag_id].discard(pk)
+            if new:
+                self.recipes[pk] = new
+            else:
+                self.recipes.pop(pk, None)
+
+    def get_rows(self, recipe_ids):
+        """Recipe rows by id, as RecipeEncoder reads them."""
+        return {
+            pk: {
+                name: getattr(self.recipes[pk], name)
+                for name in RECIPE_COLUMNS
+            }
+            for pk in recipe_ids if pk in self.recipes
+        }
+
+    def get_versions(self, recipe_ids):
+        """Count and last updated_at of the recipes known by id."""
+        updated = [
+            self.recipes[pk].updated_at
+            for pk in recipe_ids if pk in self.recipes
+        ]
+        return {
+            'count': len(updated),
+            'updated_at': max(updated) if updated else None,
+        }
+
+    def get_tags(self, recipe_ids, expand=True):
+        tags = defaultdict(list)
+        for pk in recipe_ids:
+            if pk not in self.recipes:
+                continue
+            tag_ids = sorted(
+                (
+                    tag_id for tag_id in self.recipes[pk].tag_ids
+                    if tag_id in self.tags
+                ),
+                key=self.tag_order.__getitem__,
+            )
+            if not expand:
+                tags[pk] = tag_ids
+                continue
+            tags[pk] = [
+                {name: getattr(self.tags[tag_id], name)
+                 for name in TAG_COLUMNS}
+                for tag_id in tag_ids
+            ]
+        return tags
+
+    def get_ingredients(self, recipe_ids, expand=True):
+        ingredients = defaultdict(list)
+        for pk in recipe_ids:
+            if pk not in self.recipes:
+                continue
+            pairs = self.recipes[pk].ingredients
+            # Recipe ingredients are ordered by the ingredient name.
+            for product_id, amount in sorted(
+                zip(pairs[::2], pairs[1::2]),
+                key=lambda pair: (self.ingredients[pair[0]].name, pair[0]),
+            ):
+                if not expand:
+                    ingredients[pk].append(
+                        {'id': product_id, 'amount': amount}
+                    )
+                    continue
+                product = self.ingredients[product_id]
+                ingredients[pk].append({
+                    'id': str(product_id),
+                    'name': product.name,
+                    'measurement_unit': product.measurement_unit,
+                    'amount': amount,
+                })
+        return ingredients
+
+    def get_tagged(self, tag_ids, match_all=False):
+        """Ids of recipes with any, or all, of the tags."""
+        sets = [self.tagged.get(tag_id, set()) for tag_id in tag_ids]
+        if not sets:
+            return set()
+        if match_all:
+            return set.intersection(*sets)
+        return set.union(*sets)
+
+
+def get_catalog():
+    """Catalog snapshot of this process, None when it is disabled.
+
+    The first call builds it. Later calls refresh it once per
+    CATALOG_REFRESH_INTERVAL; a process idle for long enough to miss
+    pruned changes builds it again.
+    """
+    global snapshot
+    if not settings.CATALOG_SNAPSHOT:
+        return None
+    if snapshot is None or (
+        time.monotonic() - snapshot.refreshed_at
+        > settings.CATALOG_CHANGE_RETENTION / 2
+    ):
+        with lock:
+            if snapshot is None or (
+                time.monotonic() - snapshot.refreshed_at
+                > settings.CATALOG_CHANGE_RETENTION / 2
+            ):
+                snapshot = Catalog().build()
+    elif (
+        time.monotonic() - snapshot.refreshed_at
+        > settings.CATALOG_REFRESH_INTERVAL
+        and lock.acquire(blocking=False)
+    ):
+        # Other threads keep reading the snapshot meanwhile.
+        try:
+            snapshot.refresh()
+        finally:
+            lock.release()
+    return snapshot
@@ -0,0 +1,231 @@
+import re
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.db import models, transaction
+from scipy import sparse
+from scipy.sparse import csgraph
+
+from recipes import shopping_lists, totals
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+from recipes.signals import touch_recipes
+
+
+def normalize(name):
+    return ' '.join(re.findall(r'\w+', name.lower().replace('ё', 'е')))
+
+
+def get_trigrams(name):
+    padded = f'  {normalize(name)} '
+    return {padded[start:start + 3] for start in range(len(padded) - 2)}
+
+
+def count_edits(first, second):
+    """Levenshtein distance of two strings."""
+    previous = list(range(len(second) + 1))
+    for index, char in enumerate(first, 1):
+        current = [index]
+        for column, other in enumerate(second, 1):
+            current.append(min(
+                previous[column] + 1,
+                current[column - 1] + 1,
+                previous[column - 1] + (char != other),
+            ))
+        previous = current
+    return previous[-1]
+
+
+def is_duplicate(first, second):
+    """Whether two (name, measurement unit) pairs are the same ingredient.
+
+    Names must have the same unit and numbers ("творог 5%" and
+    "творог 9%" differ) and, words sorted, differ by at most one typo per
+    DEDUP_CHARS_PER_EDIT characters, rounded.
+    """
+    if first[1] != second[1]:
+        return False
+    if sorted(re.findall(r'\d+', first[0])) != sorted(
+        re.findall(r'\d+', second[0])
+    ):
+        return False
+    first, second = (
+        ' '.join(sorted(normalize(name).split()))
+        for name, _ in (first, second)
+    )
+    chars = settings.DEDUP_CHARS_PER_EDIT
+    return count_edits(first, second) <= (
+        (min(len(first), len(second)) + chars // 2) // chars
+    )
+
+
+def build_index(names):
+    """Names x trigrams binary matrix and the trigram count of each name."""
+    vocabulary, indices, indptr = {}, [], [0]
+    for name in names:
+        indices.extend(
+            vocabulary.setdefault(trigram, len(vocabulary))
+            for trigram in get_trigrams(name)
+        )
+        indptr.append(len(indices))
+    index = sparse.csr_matrix(
+        (np.ones(len(indices), dtype=np.float32), indices, indptr),
+        shape=(len(names), len(vocabulary)),
+    )
+    return index, np.diff(index.indptr)
+
+
+def get_similar_pairs(index, sizes, threshold):
+    """Row and column arrays of the names with trigram Jaccard similarity
+    of at least threshold, row < column.
+
+    Shared trigram counts come from sparse products of
+    DEDUP_BLOCK_SIZE names at a time against the whole index.
+    """
+    by_trigram = index.T.tocsr()
+    rows, columns = [], []
+    block_size = settings.DEDUP_BLOCK_SIZE
+    for start in range(0, index.shape[0], block_size):
+        shared = (index[start:start + block_size] @ by_trigram).tocoo()
+        row = shared.row + start
+        keep = row < shared.col
+        row, column, common = row[keep], shared.col[keep], shared.data[keep]
+        similarity = common / (sizes[row] + sizes[column] - common)
+        keep = similarity >= threshold
+        rows.append(row[keep])
+        columns.append(column[keep])
+    return np.concatenate(rows), np.concatenate(columns)
+
+
+def find_clusters(threshold):
+    """Lists of near-duplicate ingredients, the one to keep first.
+
+    The trigram index finds candidate pairs, is_duplicate confirms them.
+    The kept one is the most used, and members are the duplicates of it,
+    so chains of small differences do not pull unrelated names together.
+    """
+    ingredients = list(
+        Ingredient.objects.annotate(
+            uses=models.Count('recipe_ingredient')
+        ).order_by('pk').values_list(
+            'pk', 'name', 'measurement_unit', 'uses'
+        )
+    )
+    index, sizes = build_index([name for _, name, _, _ in ingredients])
+    rows, columns = get_similar_pairs(index, sizes, threshold)
+    keep = np.fromiter(
+        (
+            is_duplicate(ingredients[row][1:3], ingredients[column][1:3])
+            for row, column in zip(rows.tolist(), columns.tolist())
+        ),
+        dtype=bool,
+        count=len(rows),
+    )
+    rows, columns = rows[keep], columns[keep]
+    pairs = set(zip(rows.tolist(), columns.tolist()))
+    graph = sparse.coo_matrix(
+        (np.ones(len(rows)), (rows, columns)),
+        shape=(len(ingredients),) * 2,
+    )
+    _, labels = csgraph.connected_components(graph, directed=False)
+    components = defaultdict(list)
+    for row in np.unique(np.concatenate((rows, columns))).tolist():
+        components[labels[row]].append(row)
+    clusters = []
+    for members in components.values():
+        kept = min(members, key=lambda row: (-ingredients[row][3], row))
+        cluster = [ingredients[kept]] + [
+            ingredients[row] for row in members
+            if row != kept
+            and (min(row, kept), max(row, kept)) in pairs
+        ]
+        if len(cluster) > 1:
+            clusters.append(cluster)
+    return sorted(clusters, key=lambda cluster: cluster[0][1])
+
+
+def merge_recipes(recipe_ids, targets):
+    """Point recipe ingredients of duplicates to the kept ingredients.
+
+    targets maps duplicate ids to kept ids. Rows of a recipe that end up
+    with the same ingredient are merged into one with the summed amount.
+    Totals, shopping lists and updated_at of the recipes are kept right.
+    """
+    products = set(targets) | set(targets.values())
+    rows = RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids, product_id__in=products
+    )
+    before = list(
+        rows.select_for_update().values_list(
+            'pk', 'recipe_id', 'product_id', 'amount'
+        )
+    )
+    groups = defaultdict(list)
+    for pk, recipe_id, product_id, amount in before:
+        groups[recipe_id, targets.get(product_id, product_id)].append(
+            (pk, product_id, amount)
+        )
+    updated, merged, created = defaultdict(list), [], []
+    for (recipe_id, product_id), group in groups.items():
+        if len(group) > 1:
+            merged.extend(pk for pk, _, _ in group)
+            created.append(RecipeIngredient(
+                recipe_id=recipe_id,
+                product_id=product_id,
+                amount=sum(amount for _, _, amount in group),
+            ))
+        elif group[0][1] != product_id:
+            updated[product_id].append(group[0][0])
+    if not updated and not merged:
+        return
+    shopping_lists.change_recipe_items(
+        (row[1:] for row in before), sign=-1
+    )
+    for product_id, pks in updated.items():
+        RecipeIngredient.objects.filter(pk__in=pks).update(
+            product_id=product_id
+        )
+    # Raw delete: the post_delete handlers would subtract the rows again.
+    merged_rows = RecipeIngredient.objects.filter(pk__in=merged)
+    merged_rows._raw_delete(merged_rows.db)
+    RecipeIngredient.objects.bulk_create(created)
+    shopping_lists.change_recipe_items(rows.values_list(
+        'recipe_id', 'product_id', 'amount'
+    ))
+    recipes = Recipe._base_manager.filter(pk__in=recipe_ids)
+    totals.recompute_totals(recipes)
+    touch_recipes(recipes)
+
+
+def merge_ingredients(targets, batch_size):
+    """Move recipes of the duplicates in targets to the kept ingredients
+    batch_size recipes per transaction, then delete the duplicates.
+
+    Returns the number of recipes changed.
+    """
+    duplicates = RecipeIngredient.objects.filter(product_id__in=targets)
+    changed = 0
+    while True:
+        recipe_ids = list(
+            duplicates.order_by('recipe_id').values_list(
+                'recipe_id', flat=True
+            ).distinct()[:batch_size]
+        )
+        if not recipe_ids:
+            break
+        with transaction.atomic():
+            merge_recipes(recipe_ids, targets)
+        changed += len(recipe_ids)
+    with transaction.atomic():
+        # Recipes saved meanwhile wait for the lock and are moved here.
+        list(Ingredient.objects.filter(
+            pk__in=targets
+        ).select_for_update().values('pk'))
+        recipe_ids = list(
+            duplicates.order_by().values_list(
+                'recipe_id', flat=True
+            ).distinct()
+        )
+        merge_recipes(recipe_ids, targets)
+        Ingredient.objects.filter(pk__in=targets).delete()
+    return changed + len(recipe_ids)
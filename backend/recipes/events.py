@@ -0,0 +1,128 @@
+import json
+import logging
+import select
+import time
+from collections import defaultdict
+from threading import Lock, Thread
+
+from django.conf import settings
+from django.db import connection, transaction
+
+EVENTS_CHANNEL = 'foodgram_events'
+
+logger = logging.getLogger(__name__)
+
+
+def notify(message):
+    """Send message to the event streams of every process on commit.
+
+    On PostgreSQL this is a NOTIFY, delivered by the database when the
+    transaction commits. Other databases have no NOTIFY, so the message
+    only reaches the streams of this process.
+    """
+    payload = json.dumps(message)
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_notify(%s, %s)', [EVENTS_CHANNEL, payload]
+            )
+    else:
+        transaction.on_commit(lambda: broker.dispatch(payload))
+
+
+class Subscription:
+    """Event stream of a user, fed from the broker thread."""
+
+    def __init__(self, user_id, author_ids, loop, queue):
+        self.user_id = user_id
+        self.author_ids = set(author_ids)
+        self.loop = loop
+        self.queue = queue
+
+    def put(self, event):
+        self.loop.call_soon_threadsafe(self.offer, event)
+
+    def offer(self, event):
+        # A stream too slow to read its queue loses events; the client
+        # gets them back with Last-Event-ID when it reconnects.
+        if not self.queue.full():
+            self.queue.put_nowait(event)
+
+
+class Broker:
+    """Pass recipe events to the subscriptions of the recipe author.
+
+    On PostgreSQL one thread per process LISTENs to EVENTS_CHANNEL on
+    its own connection, started with the first subscription.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.by_author = defaultdict(set)
+        self.by_user = defaultdict(set)
+        self.listener = None
+
+    def subscribe(self, user_id, author_ids, loop, queue):
+        subscription = Subscription(user_id, author_ids, loop, queue)
+        with self.lock:
+            self.by_user[user_id].add(subscription)
+            for author_id in subscription.author_ids:
+                self.by_author[author_id].add(subscription)
+            if self.listener is None and connection.vendor == 'postgresql':
+                self.listener = Thread(
+                    target=self.listen, name='events', daemon=True
+                )
+                self.listener.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.discard(self.by_user, subscription.user_id, subscription)
+            for author_id in subscription.author_ids:
+                self.discard(self.by_author, author_id, subscription)
+
+    @staticmethod
+    def discard(subscriptions, key, subscription):
+        subscriptions[key].discard(subscription)
+        if not subscriptions[key]:
+            del subscriptions[key]
+
+    def dispatch(self, payload):
+        message = json.loads(payload)
+        with self.lock:
+            if message['type'] == 'follow':
+                self.change_follow(message)
+                return
+            subscriptions = list(self.by_author.get(message['author'], ()))
+        for subscription in subscriptions:
+            subscription.put(message)
+
+    def change_follow(self, message):
+        author_id = message['author']
+        for subscription in self.by_user.get(message['user'], ()):
+            if message['followed']:
+                subscription.author_ids.add(author_id)
+                self.by_author[author_id].add(subscription)
+            elif author_id in subscription.author_ids:
+                subscription.author_ids.discard(author_id)
+                self.discard(self.by_author, author_id, subscription)
+
+    def listen(self):
+        """Dispatch NOTIFY payloads, reconnecting when the database fails."""
+        while True:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN {EVENTS_CHANNEL}')
+                raw = connection.connection
+                while True:
+                    select.select([raw], [], [])
+                    raw.poll()
+                    while raw.notifies:
+                        self.dispatch(raw.notifies.pop(0).payload)
+            except Exception:
+                logger.exception('Event listener failed')
+                connection.close()
+                time.sleep(settings.EVENTS_RECONNECT_DELAY)
+
+
+broker = Broker()
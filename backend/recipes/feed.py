@@ -0,0 +1,134 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models
+
+from recipes.models import FeedEntry, Recipe
+from users.models import Follow
+
+POPULAR_AUTHORS_CACHE_KEY = 'feed:popular_authors'
+
+
+def get_popular_author_ids():
+    """Authors whose recipes are merged into feeds on read."""
+    author_ids = cache.get(POPULAR_AUTHORS_CACHE_KEY)
+    if author_ids is None:
+        author_ids = set(
+            Follow.objects.values('author_id').annotate(
+                followers=models.Count('id')
+            ).filter(
+                followers__gt=settings.FEED_FANOUT_LIMIT
+            ).values_list('author_id', flat=True)
+        )
+        cache.set(
+            POPULAR_AUTHORS_CACHE_KEY,
+            author_ids,
+            settings.FEED_POPULAR_AUTHORS_TIMEOUT
+        )
+    return author_ids
+
+
+def create_entries(recipes, user_ids):
+    """Add (recipe_id, author_id, pub_date) rows to the users timelines."""
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(
+                user_id=user_id,
+                recipe_id=recipe_id,
+                author_id=author_id,
+                pub_date=pub_date,
+            )
+            for user_id in user_ids
+            for recipe_id, author_id, pub_date in recipes
+        ),
+        batch_size=settings.FEED_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def fan_out_recipe(recipe_id):
+    """Write a new recipe into the timelines of the author followers."""
+    recipe = Recipe.objects.filter(pk=recipe_id).values_list(
+        'id', 'author_id', 'pub_date'
+    ).first()
+    if recipe is None or recipe[1] in get_popular_author_ids():
+        return
+    followers = Follow.objects.filter(author_id=recipe[1]).values_list(
+        'user_id', flat=True
+    ).order_by()
+    batch = []
+    for user_id in followers.iterator(chunk_size=settings.FEED_BATCH_SIZE):
+        batch.append(user_id)
+        if len(batch) == settings.FEED_BATCH_SIZE:
+            create_entries((recipe,), batch)
+            batch = []
+    create_entries((recipe,), batch)
+
+
+def get_latest_recipes(author_id):
+    return Recipe.objects.filter(author_id=author_id).values_list(
+        'id', 'author_id', 'pub_date'
+    )[:settings.FEED_BACKFILL_SIZE]
+
+
+def add_subscription(user_id, author_id):
+    """Backfill the latest author recipes into a new subscriber feed."""
+    # Jobs of a quick unfollow and follow may run in any order.
+    if author_id in get_popular_author_ids() or not Follow.objects.filter(
+        user_id=user_id, author_id=author_id
+    ).exists():
+        return
+    create_entries(get_latest_recipes(author_id), (user_id,))
+
+
+def remove_subscription(user_id, author_id):
+    if Follow.objects.filter(user_id=user_id, author_id=author_id).exists():
+        return
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def backfill_feeds():
+    """Add the latest recipes of followed authors to every feed.
+
+    Fills the timelines of follows made before they existed, or repairs
+    them; entries already there are kept. Returns the number of follows.
+    """
+    follows = Follow.objects.exclude(
+        author_id__in=get_popular_author_ids()
+    ).order_by('pk').values_list('pk', 'user_id', 'author_id')
+    last_pk, count = 0, 0
+    while True:
+        batch = list(
+            follows.filter(pk__gt=last_pk)[:settings.FEED_BATCH_SIZE]
+        )
+        if not batch:
+            return count
+        followers = defaultdict(list)
+        for _, user_id, author_id in batch:
+            followers[author_id].append(user_id)
+        for author_id, user_ids in followers.items():
+            create_entries(get_latest_recipes(author_id), user_ids)
+        last_pk = batch[-1][0]
+        count += len(batch)
+
+
+def get_feed(user):
+    """Feed as (recipe_id, pub_date) rows, newest first."""
+    feed = FeedEntry.objects.filter(user=user).values_list(
+        'recipe_id', 'pub_date'
+    )
+    popular_author_ids = get_popular_author_ids()
+    if popular_author_ids:
+        popular_author_ids = list(
+            Follow.objects.filter(
+                user=user, author_id__in=popular_author_ids
+            ).values_list('author_id', flat=True)
+        )
+    if popular_author_ids:
+        feed = feed.order_by().union(
+            Recipe.objects.filter(
+                author_id__in=popular_author_ids
+            ).values_list('id', 'pub_date').order_by()
+        )
+    return feed.order_by('-pub_date')
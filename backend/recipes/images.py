@@ -0,0 +1,54 @@
+import hashlib
+import io
+import os
+
+from django.core.files.base import ContentFile
+from django.db import models
+from django.db.models.fields.files import ImageFieldFile
+
+WEBP_SUFFIX = '.webp'
+WEBP_QUALITY = 80
+
+
+class HashedImageFieldFile(ImageFieldFile):
+    """Image file stored under the SHA-256 of its content."""
+
+    def save(self, name, content, save=True):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        name = f'{digest[:2]}/{digest}{extension}'
+        stored_name = self.field.generate_filename(self.instance, name)
+        if not self.storage.exists(stored_name):
+            return super().save(name, content, save=save)
+        self.name = stored_name
+        setattr(self.instance, self.field.attname, self.name)
+        self._committed = True
+        if save:
+            self.instance.save()
+
+
+class HashedImageField(models.ImageField):
+    """ImageField with immutable, content-hashed file names."""
+
+    attr_class = HashedImageFieldFile
+
+
+def save_webp_variant(image):
+    """Store a WebP copy next to the image for clients that accept it."""
+    if not image:
+        return
+    name = image.name + WEBP_SUFFIX
+    if image.storage.exists(name):
+        return
+    from PIL import Image
+
+    output = io.BytesIO()
+    try:
+        with image.open('rb'), Image.open(image) as picture:
+            picture.save(output, 'WEBP', quality=WEBP_QUALITY)
+    except (OSError, ValueError):
+        return
+    image.storage.save(name, ContentFile(output.getvalue()))
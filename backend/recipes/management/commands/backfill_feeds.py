@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from recipes.feed import backfill_feeds
+
+
+class Command(BaseCommand):
+    help = "Fill subscription feeds with recent recipes of followed authors"
+
+    def handle(self, *args, **options):
+        count = backfill_feeds()
+        self.stdout.write(f"Backfilled feeds of {count} subscriptions.")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from recipes.models import SimilarRecipe
+from recipes.similarity import get_changes, refresh_similar_recipes
+
+
+class Command(BaseCommand):
+    help = "Precompute similar recipes from co-favorites and shopping carts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Rebuild all recipes, not only the changed ones.',
+        )
+
+    def handle(self, *args, **options):
+        if options['full'] or not SimilarRecipe.objects.exists():
+            count = refresh_similar_recipes(changes=get_changes()[1])
+        else:
+            count = refresh_similar_recipes(*get_changes())
+        self.stdout.write(f"Refreshed similar recipes of {count} recipes.")
@@ -0,0 +1,52 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recipes.dedup import find_clusters, merge_ingredients
+
+
+class Command(BaseCommand):
+    help = "Find near-duplicate ingredients and optionally merge them"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=settings.DEDUP_THRESHOLD,
+            help='Trigram Jaccard similarity of names to merge, 0 to 1.',
+        )
+        parser.add_argument(
+            '--apply',
+            action='store_true',
+            help='Merge the clusters instead of only listing them.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.DEDUP_BATCH_SIZE,
+            help='Recipes changed per transaction.',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        clusters = find_clusters(options['threshold'])
+        self.stdout.write(
+            f"Found {len(clusters)} clusters in "
+            f"{time.monotonic() - started:.2f}s."
+        )
+        targets = {}
+        for (kept_pk, name, unit, uses), *duplicates in clusters:
+            self.stdout.write(
+                f"{name} ({unit}, {uses} recipes) <- " + ', '.join(
+                    f"{duplicate_name} ({duplicate_uses})"
+                    for _, duplicate_name, _, duplicate_uses in duplicates
+                )
+            )
+            for duplicate_pk, *_ in duplicates:
+                targets[duplicate_pk] = kept_pk
+        if options['apply'] and targets:
+            changed = merge_ingredients(targets, options['batch_size'])
+            self.stdout.write(
+                f"Merged {len(targets)} ingredients, changed {changed} "
+                f"recipes."
+            )
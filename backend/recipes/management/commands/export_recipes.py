@@ -0,0 +1,62 @@
+import os
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from recipes.export import (EXPORT_FORMATS, export_recipes,
+                            truncate_to_last_record)
+
+
+class Command(BaseCommand):
+    help = "Stream recipes with authors, tags and ingredients to a file"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format', choices=EXPORT_FORMATS, default='ndjson'
+        )
+        parser.add_argument(
+            '--output', help='File to write, standard output by default.'
+        )
+        parser.add_argument(
+            '--after',
+            type=int,
+            default=0,
+            help='Export recipes with a greater id only.',
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Continue an interrupted NDJSON export into --output.',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=settings.EXPORT_CHUNK_SIZE
+        )
+
+    def handle(self, *args, **options):
+        after = options['after']
+        mode = 'w'
+        if options['resume']:
+            if options['format'] != 'ndjson' or not options['output']:
+                raise CommandError(
+                    '--resume needs --output and the ndjson format; '
+                    'continue a CSV export with --after.'
+                )
+            if os.path.exists(options['output']):
+                after = truncate_to_last_record(options['output'])
+                mode = 'a'
+        output = sys.stdout
+        if options['output']:
+            output = open(
+                options['output'], mode, encoding='utf-8', newline=''
+            )
+        count = 0
+        try:
+            for line in export_recipes(
+                options['format'], after, options['chunk_size']
+            ):
+                output.write(line)
+                count += 1
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        self.stderr.write(f"Exported {count} lines after id {after}.")
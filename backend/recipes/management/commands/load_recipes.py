@@ -0,0 +1,199 @@
+import base64
+import binascii
+import io
+import json
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from jobs.workers import setup_worker
+from PIL import Image
+from recipes.catalog import log_changes
+from recipes.images import save_webp_variant
+from recipes.models import (CatalogChange, Ingredient, Recipe,
+                            RecipeIngredient, Tag)
+from recipes.totals import recompute_totals
+from users.models import User
+
+IMAGE_EXTENSIONS = {'JPEG': 'jpg'}
+
+
+def save_image_data(data):
+    """Decode a base64 image, store it and return its name or None."""
+    if data.startswith('data:'):
+        data = data.partition(',')[2]
+    try:
+        content = base64.b64decode(data, validate=True)
+        with Image.open(io.BytesIO(content)) as picture:
+            image_format = picture.format
+            picture.verify()
+    except (binascii.Error, OSError, ValueError, Image.DecompressionBombError):
+        return None
+    extension = IMAGE_EXTENSIONS.get(image_format, image_format.lower())
+    recipe = Recipe()
+    recipe.image.save(f'image.{extension}', ContentFile(content), save=False)
+    save_webp_variant(recipe.image)
+    return recipe.image.name
+
+
+def get_username(author):
+    if isinstance(author, dict):
+        return author.get('username')
+    return author
+
+
+class Command(BaseCommand):
+    help = "Bulk load recipes from NDJSON, e.g. an export_recipes file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.LOAD_BATCH_SIZE
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.LOAD_IMAGE_WORKERS,
+            help='Processes decoding base64 images.',
+        )
+
+    def handle(self, *args, **options):
+        self.tags = dict(Tag.objects.values_list('slug', 'id'))
+        self.ingredients = {
+            (name, unit): pk for pk, name, unit in
+            Ingredient.objects.values_list('id', 'name', 'measurement_unit')
+        }
+        self.ingredient_ids = set(self.ingredients.values())
+        self.authors = {}
+        self.loaded = self.skipped = 0
+        connections.close_all()
+        pool = ProcessPoolExecutor(
+            max_workers=options['workers'],
+            mp_context=get_context('spawn'),
+            initializer=setup_worker,
+        )
+        with pool, open(options['path'], encoding='utf-8') as file:
+            lines = enumerate(file, start=1)
+            pending = None
+            while True:
+                chunk = list(islice(lines, options['batch_size']))
+                if not chunk and pending is None:
+                    break
+                # A chunk of invalid lines parses to an empty batch, which
+                # does not end the input.
+                batch = self.parse(chunk)
+                # Images of this batch are decoded while the previous
+                # one is written.
+                images = pool.map(
+                    save_image_data,
+                    [record['image'] for _, record in batch
+                     if record['image'].startswith('data:')],
+                    chunksize=16,
+                )
+                if pending is not None:
+                    self.write(*pending)
+                pending = (batch, images) if batch else None
+        self.stdout.write(
+            f"Loaded {self.loaded} recipes, skipped {self.skipped}."
+        )
+
+    def skip(self, number, reason):
+        self.skipped += 1
+        self.stderr.write(f"Line {number}: {reason}")
+
+    def parse(self, lines):
+        """Decode and validate lines, resolving tags and ingredients."""
+        batch = []
+        for number, line in lines:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                recipe = {
+                    'name': record['name'],
+                    'text': record['text'],
+                    'cooking_time': int(record['cooking_time']),
+                    'image': record['image'],
+                    'author': get_username(record['author']),
+                    'tags': [self.tags[slug] for slug in record['tags']],
+                    'ingredients': {
+                        self.get_ingredient_id(item): int(item['amount'])
+                        for item in record['ingredients']
+                    },
+                }
+            except (ValueError, KeyError, TypeError) as error:
+                self.skip(number, f'invalid record ({error!r}).')
+                continue
+            if not (
+                recipe['name'] and recipe['image'] and recipe['ingredients']
+                and 1 <= recipe['cooking_time'] <= 120
+                and min(recipe['ingredients'].values()) > 0
+            ):
+                self.skip(number, 'missing or invalid values.')
+                continue
+            batch.append((number, recipe))
+        return batch
+
+    def get_ingredient_id(self, item):
+        if 'id' in item:
+            if int(item['id']) not in self.ingredient_ids:
+                raise KeyError(item['id'])
+            return int(item['id'])
+        return self.ingredients[(item['name'], item['measurement_unit'])]
+
+    def resolve_authors(self, usernames):
+        missing = set(usernames) - self.authors.keys()
+        if missing:
+            self.authors.update(
+                User.objects.filter(
+                    username__in=missing
+                ).values_list('username', 'id')
+            )
+
+    def write(self, batch, images):
+        """Insert a batch of recipes with three bulk inserts."""
+        self.resolve_authors(recipe['author'] for _, recipe in batch)
+        recipes = []
+        for number, recipe in batch:
+            if recipe['image'].startswith('data:'):
+                recipe['image'] = next(images)
+            if recipe['image'] is None:
+                self.skip(number, 'invalid image.')
+            elif recipe['author'] not in self.authors:
+                self.skip(number, f'unknown author {recipe["author"]!r}.')
+            else:
+                recipes.append(recipe)
+        objs = [
+            Recipe(
+                name=recipe['name'],
+                text=recipe['text'],
+                cooking_time=recipe['cooking_time'],
+                image=recipe['image'],
+                author_id=self.authors[recipe['author']],
+            )
+            for recipe in recipes
+        ]
+        with transaction.atomic():
+            Recipe.objects.bulk_create(objs)
+            Recipe.tags.through.objects.bulk_create(
+                Recipe.tags.through(recipe_id=obj.pk, tag_id=tag_id)
+                for obj, recipe in zip(objs, recipes)
+                for tag_id in set(recipe['tags'])
+            )
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe_id=obj.pk, product_id=product_id, amount=amount
+                )
+                for obj, recipe in zip(objs, recipes)
+                for product_id, amount in recipe['ingredients'].items()
+            )
+            recompute_totals(
+                Recipe.objects.filter(pk__in=[obj.pk for obj in objs])
+            )
+            log_changes(CatalogChange.RECIPE, (obj.pk for obj in objs))
+        self.loaded += len(objs)
+        self.stdout.write(f"Loaded {self.loaded} recipes.")
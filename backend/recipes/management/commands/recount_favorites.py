@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recipes.models import Recipe
+from recipes.totals import recount_favorites
+
+
+class Command(BaseCommand):
+    help = "Recount recipe favorites_count from favorites"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.TOTALS_BATCH_SIZE,
+            help='Recipes updated per statement.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        recipes = Recipe.objects.order_by('pk').values_list('pk', flat=True)
+        last_pk, updated = 0, 0
+        while True:
+            batch = list(recipes.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            updated += recount_favorites(Recipe.objects.filter(pk__in=batch))
+            last_pk = batch[-1]
+            self.stdout.write(f"Recounted favorites of {updated} recipes.")
@@ -1,9 +1,9 @@
-import csv
 from pathlib import Path
 
 from django.core.management.base import BaseCommand
 from foodgram.settings import BASE_DIR
-from recipes.models import Ingredient
+from jobs.queue import enqueue
+from recipes.tasks import load_ingredients
 
 DATA_FILE_PATH = Path(Path(BASE_DIR, "data/"), "ingredients.csv")
 
@@ -11,16 +11,19 @@ DATA_FILE_PATH = Path(Path(BASE_DIR, "data/"), "ingredients.csv")
 class Command(BaseCommand):
     help = "Data upload from csv"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--background',
+            action='store_true',
+            help='Queue the upload for the job worker.',
+        )
+
     def handle(self, *args, **options):
-        headerList = ("name", "measurement_unit")
+        if options['background']:
+            job = enqueue('upload_ingredients', path=str(DATA_FILE_PATH))
+            self.stdout.write(f"Upload queued as job {job.pk}.")
+            return
 
         self.stdout.write("Upload data")
-        ingredients = []
-
-        with open(DATA_FILE_PATH, 'r', encoding="utf-8") as csvfile:
-            csvreader = csv.DictReader(csvfile, fieldnames=headerList)
-            ingredients = [Ingredient(**row) for row in csvreader]
-
-        Ingredient.objects.bulk_create(ingredients)
-
+        load_ingredients(DATA_FILE_PATH)
         self.stdout.write("Data uploaded successfully.")
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.3 on 2026-10-19 10:37
+
+from django.db import migrations
+import recipes.images
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_feedentry_feedentry_unique_feed_entry'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=recipes.images.HashedImageField(upload_to='recipes/images/', verbose_name='Image'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.3 on 2026-10-19 11:12
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_similarrecipe'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='calories',
+            field=models.DecimalField(blank=True, decimal_places=4, help_text='Per measurement unit.', max_digits=10, null=True, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Calories'),
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='price',
+            field=models.DecimalField(blank=True, decimal_places=4, help_text='Per measurement unit.', max_digits=10, null=True, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Price'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='calories',
+            field=models.DecimalField(decimal_places=4, default=0, editable=False, max_digits=16, verbose_name='Calories'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='cost',
+            field=models.DecimalField(decimal_places=4, default=0, editable=False, max_digits=16, verbose_name='Cost'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['calories'], name='recipe_calories_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['cost'], name='recipe_cost_idx'),
+        ),
+    ]
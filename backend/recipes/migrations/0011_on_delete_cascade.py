@@ -0,0 +1,61 @@
+import re
+
+from django.db import migrations
+
+CASCADE_TABLES = ('users_user', 'recipes_recipe')
+
+
+def set_on_delete(schema_editor, cascade):
+    """Recreate foreign keys to CASCADE_TABLES with or without cascade.
+
+    Purges delete users and recipes with plain DELETEs; the database then
+    removes the rows still referencing them.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT conrelid::regclass::text, conname, "
+            "pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE contype = 'f' AND confrelid::regclass::text = ANY(%s) "
+            "AND (confdeltype = 'c') <> %s",
+            [list(CASCADE_TABLES), cascade],
+        )
+        constraints = cursor.fetchall()
+    quote = schema_editor.quote_name
+    for table, name, definition in constraints:
+        if cascade:
+            definition = re.sub(
+                r'(REFERENCES \S+\([^)]*\))', r'\1 ON DELETE CASCADE',
+                definition, count=1
+            )
+        else:
+            definition = definition.replace(' ON DELETE CASCADE', '')
+        schema_editor.execute(
+            f'ALTER TABLE {quote(table)} DROP CONSTRAINT {quote(name)}, '
+            f'ADD CONSTRAINT {quote(name)} {definition}'
+        )
+
+
+def add_cascade(apps, schema_editor):
+    set_on_delete(schema_editor, True)
+
+
+def remove_cascade(apps, schema_editor):
+    set_on_delete(schema_editor, False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipe_deleted_at'),
+        ('users', '0002_user_deleted_at'),
+        ('jobs', '0001_initial'),
+        ('authtoken', '0003_tokenproxy'),
+        ('admin', '0003_logentry_add_action_flag_choices'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_cascade, remove_cascade),
+    ]
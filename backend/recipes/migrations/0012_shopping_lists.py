@@ -0,0 +1,70 @@
+# Generated by Django 4.2.3 on 2026-10-19 11:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0011_on_delete_cascade'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingList',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=128, verbose_name='Name')),
+                ('members', models.ManyToManyField(related_name='shopping_lists', to=settings.AUTH_USER_MODEL, verbose_name='Members')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='owned_shopping_lists', to=settings.AUTH_USER_MODEL, verbose_name='Owner')),
+            ],
+            options={
+                'verbose_name': 'Shopping list',
+                'verbose_name_plural': 'Shopping lists',
+                'ordering': ('name', 'id'),
+            },
+        ),
+        migrations.CreateModel(
+            name='ShoppingListRecipe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='list_recipes', to='recipes.recipe', verbose_name='Recipe')),
+                ('shopping_list', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='list_recipes', to='recipes.shoppinglist', verbose_name='Shopping list')),
+            ],
+            options={
+                'verbose_name': 'Shopping list recipe',
+                'verbose_name_plural': 'Shopping list recipes',
+            },
+        ),
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField(default=0, verbose_name='Amount')),
+                ('checked', models.BooleanField(default=False, verbose_name='Purchased')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes.ingredient', verbose_name='Ingredient')),
+                ('shopping_list', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='recipes.shoppinglist', verbose_name='Shopping list')),
+            ],
+            options={
+                'verbose_name': 'Shopping list item',
+                'verbose_name_plural': 'Shopping list items',
+                'ordering': ('product',),
+            },
+        ),
+        migrations.AddField(
+            model_name='shoppinglist',
+            name='recipes',
+            field=models.ManyToManyField(related_name='shopping_lists', through='recipes.ShoppingListRecipe', to='recipes.recipe', verbose_name='Recipes'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistrecipe',
+            constraint=models.UniqueConstraint(fields=('shopping_list', 'recipe'), name='unique_shopping_list_recipe'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistitem',
+            constraint=models.UniqueConstraint(fields=('shopping_list', 'product'), name='unique_shopping_list_item'),
+        ),
+    ]
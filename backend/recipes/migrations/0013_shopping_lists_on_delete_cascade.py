@@ -0,0 +1,55 @@
+import re
+
+from django.db import migrations
+
+# Foreign keys are created at the end of a migration, so the ones of the
+# shopping list tables are changed by a migration of their own.
+CASCADE_TABLES = ('users_user', 'recipes_recipe', 'recipes_shoppinglist')
+
+
+def set_on_delete(schema_editor, cascade):
+    """Recreate foreign keys to CASCADE_TABLES with or without cascade.
+
+    Purges delete users and recipes with plain DELETEs; the database then
+    removes the rows still referencing them.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT conrelid::regclass::text, conname, "
+            "pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE contype = 'f' AND confrelid::regclass::text = ANY(%s) "
+            "AND (confdeltype = 'c') <> %s",
+            [list(CASCADE_TABLES), cascade],
+        )
+        constraints = cursor.fetchall()
+    quote = schema_editor.quote_name
+    for table, name, definition in constraints:
+        if cascade:
+            definition = re.sub(
+                r'(REFERENCES \S+\([^)]*\))', r'\1 ON DELETE CASCADE',
+                definition, count=1
+            )
+        else:
+            definition = definition.replace(' ON DELETE CASCADE', '')
+        schema_editor.execute(
+            f'ALTER TABLE {quote(table)} DROP CONSTRAINT {quote(name)}, '
+            f'ADD CONSTRAINT {quote(name)} {definition}'
+        )
+
+
+def add_cascade(apps, schema_editor):
+    set_on_delete(schema_editor, True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_shopping_lists'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_cascade, migrations.RunPython.noop),
+    ]
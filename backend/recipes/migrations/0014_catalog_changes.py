@@ -0,0 +1,26 @@
+# Generated by Django 4.2.3 on 2026-10-19 11:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_shopping_lists_on_delete_cascade'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('recipe', 'Recipe'), ('tag', 'Tag'), ('ingredient', 'Ingredient')], max_length=16, verbose_name='Kind')),
+                ('object_id', models.BigIntegerField(verbose_name='Object id')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Creation Date')),
+            ],
+            options={
+                'verbose_name': 'Catalog change',
+                'verbose_name_plural': 'Catalog changes',
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.3 on 2026-10-19 12:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_catalog_changes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='similaritychange',
+            name='changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Change Date'),
+            preserve_default=False,
+        ),
+    ]
@@ -1,9 +1,16 @@
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 
+from foodgram.softdelete import AliveManager
+from recipes.images import HashedImageField
 from users.models import User
 
 TEXT_CUT = 50
+RATE_DIGITS = 10
+TOTAL_DIGITS = 16
+DECIMAL_PLACES = 4
+# Recipe fields only changed by UPDATEs of the signals.
+RECIPE_COUNTER_FIELDS = ('calories', 'cost', 'favorites_count')
 
 
 class Recipe(models.Model):
@@ -19,8 +26,8 @@ class Recipe(models.Model):
         related_name='recipes',
         verbose_name='Publication Author',
     )
-    image = models.ImageField(
-        upload_to='media/%Y%m%d',
+    image = HashedImageField(
+        upload_to='recipes/images/',
         verbose_name='Image',
     )
     ingredients = models.ManyToManyField(
@@ -46,15 +53,77 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Publication Date',
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Update Date',
+    )
+    calories = models.DecimalField(
+        max_digits=TOTAL_DIGITS,
+        decimal_places=DECIMAL_PLACES,
+        default=0,
+        editable=False,
+        verbose_name='Calories',
+    )
+    cost = models.DecimalField(
+        max_digits=TOTAL_DIGITS,
+        decimal_places=DECIMAL_PLACES,
+        default=0,
+        editable=False,
+        verbose_name='Cost',
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Favorites count',
+    )
+    deleted_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Deletion Date',
+    )
+
+    objects = AliveManager()
 
     class Meta:
-        ordering = ('-pub_date',)
+        ordering = ('-pub_date', '-id')
         verbose_name = 'Recipe'
         verbose_name_plural = 'Recipes'
+        indexes = (
+            models.Index(fields=('calories',), name='recipe_calories_idx'),
+            models.Index(fields=('cost',), name='recipe_cost_idx'),
+            models.Index(
+                fields=('pub_date', 'id'), name='recipe_pub_date_idx'
+            ),
+            models.Index(
+                fields=('cooking_time', 'id'), name='recipe_cooking_time_idx'
+            ),
+            models.Index(fields=('name', 'id'), name='recipe_name_idx'),
+            models.Index(
+                fields=('favorites_count', 'id'),
+                name='recipe_popularity_idx'
+            ),
+            models.Index(
+                fields=('deleted_at',),
+                condition=models.Q(deleted_at__isnull=False),
+                name='recipe_deleted_idx'
+            ),
+        )
 
     def __str__(self):
         return self.text[:TEXT_CUT]
 
+    def save(self, *args, **kwargs):
+        # Counters are kept with UPDATEs; writing the whole row back
+        # would overwrite concurrent changes with stale values.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in RECIPE_COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
 
 class Ingredient(models.Model):
     """Ingredient model."""
@@ -67,6 +136,24 @@ class Ingredient(models.Model):
         max_length=32,
         verbose_name='Measure',
     )
+    calories = models.DecimalField(
+        max_digits=RATE_DIGITS,
+        decimal_places=DECIMAL_PLACES,
+        null=True,
+        blank=True,
+        validators=(MinValueValidator(0),),
+        help_text='Per measurement unit.',
+        verbose_name='Calories',
+    )
+    price = models.DecimalField(
+        max_digits=RATE_DIGITS,
+        decimal_places=DECIMAL_PLACES,
+        null=True,
+        blank=True,
+        validators=(MinValueValidator(0),),
+        help_text='Per measurement unit.',
+        verbose_name='Price',
+    )
 
     class Meta:
         ordering = ('name',)
@@ -202,3 +289,255 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'Recipe {self.recipe} in shopping_cart of {self.user}'
+
+
+class ShoppingList(models.Model):
+    """Shopping list shared by its members."""
+
+    name = models.CharField(
+        max_length=128,
+        verbose_name='Name',
+    )
+    owner = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='owned_shopping_lists',
+        verbose_name='Owner',
+    )
+    members = models.ManyToManyField(
+        User,
+        related_name='shopping_lists',
+        verbose_name='Members',
+    )
+    recipes = models.ManyToManyField(
+        Recipe,
+        through='ShoppingListRecipe',
+        related_name='shopping_lists',
+        verbose_name='Recipes',
+    )
+
+    class Meta:
+        ordering = ('name', 'id')
+        verbose_name = 'Shopping list'
+        verbose_name_plural = 'Shopping lists'
+
+    def __str__(self):
+        return self.name[:TEXT_CUT]
+
+
+class ShoppingListRecipe(models.Model):
+    """Recipe added to a shopping list."""
+
+    shopping_list = models.ForeignKey(
+        ShoppingList,
+        on_delete=models.CASCADE,
+        related_name='list_recipes',
+        verbose_name='Shopping list',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='list_recipes',
+        verbose_name='Recipe',
+    )
+
+    class Meta:
+        verbose_name = 'Shopping list recipe'
+        verbose_name_plural = 'Shopping list recipes'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('shopping_list', 'recipe'),
+                name='unique_shopping_list_recipe'
+            ),
+        )
+
+    def __str__(self):
+        return f'Recipe {self.recipe} in {self.shopping_list}'
+
+
+class ShoppingListItem(models.Model):
+    """Ingredient total of a shopping list, kept up to date on writes."""
+
+    shopping_list = models.ForeignKey(
+        ShoppingList,
+        on_delete=models.CASCADE,
+        related_name='items',
+        verbose_name='Shopping list',
+    )
+    product = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Ingredient',
+    )
+    amount = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Amount',
+    )
+    checked = models.BooleanField(
+        default=False,
+        verbose_name='Purchased',
+    )
+
+    class Meta:
+        ordering = ('product',)
+        verbose_name = 'Shopping list item'
+        verbose_name_plural = 'Shopping list items'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('shopping_list', 'product'),
+                name='unique_shopping_list_item'
+            ),
+        )
+
+    def __str__(self):
+        return (
+            f'Product {self.product} with {self.amount} in '
+            f'{self.shopping_list}'
+        )
+
+
+class FeedEntry(models.Model):
+    """Subscription feed timeline entry."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='User',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Recipe',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Publication Author',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Publication Date',
+    )
+
+    class Meta:
+        ordering = ('-pub_date',)
+        verbose_name = 'Feed entry'
+        verbose_name_plural = 'Feed entries'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_feed_entry'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date'),
+                name='feed_user_pub_date_idx'
+            ),
+            models.Index(
+                fields=('user', 'author'),
+                name='feed_user_author_idx'
+            ),
+        )
+
+    def __str__(self):
+        return f'Recipe {self.recipe} in feed of {self.user}'
+
+
+class SimilarRecipe(models.Model):
+    """Precomputed neighbor of a recipe by co-favorite similarity."""
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_recipes',
+        verbose_name='Recipe',
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Similar recipe',
+    )
+    score = models.FloatField(
+        verbose_name='Score',
+    )
+
+    class Meta:
+        ordering = ('recipe', '-score')
+        verbose_name = 'Similar recipe'
+        verbose_name_plural = 'Similar recipes'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'similar'),
+                name='unique_similar_recipe'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('recipe', '-score'),
+                name='similar_recipe_score_idx'
+            ),
+        )
+
+    def __str__(self):
+        return f'Recipe {self.similar} similar to {self.recipe}'
+
+
+class SimilarityChange(models.Model):
+    """Recipe whose favorites or carts changed since the last refresh."""
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='+',
+        verbose_name='Recipe',
+    )
+    changed_at = models.DateTimeField(
+        verbose_name='Change Date',
+    )
+
+    class Meta:
+        verbose_name = 'Similarity change'
+        verbose_name_plural = 'Similarity changes'
+
+    def __str__(self):
+        return f'Similar recipes of {self.recipe} are stale'
+
+
+class CatalogChange(models.Model):
+    """Recipe, tag or ingredient changed, for the catalog snapshots."""
+
+    RECIPE = 'recipe'
+    TAG = 'tag'
+    INGREDIENT = 'ingredient'
+    KINDS = (
+        (RECIPE, 'Recipe'),
+        (TAG, 'Tag'),
+        (INGREDIENT, 'Ingredient'),
+    )
+
+    kind = models.CharField(
+        max_length=16,
+        choices=KINDS,
+        verbose_name='Kind',
+    )
+    object_id = models.BigIntegerField(
+        verbose_name='Object id',
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+        verbose_name='Creation Date',
+    )
+
+    class Meta:
+        verbose_name = 'Catalog change'
+        verbose_name_plural = 'Catalog changes'
+
+    def __str__(self):
+        return f'{self.get_kind_display()} {self.object_id} changed'
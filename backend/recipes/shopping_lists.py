@@ -0,0 +1,137 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest
+
+from recipes.models import (RecipeIngredient, ShoppingListItem,
+                            ShoppingListRecipe)
+
+
+def change_list_items(rows, sign=1):
+    """Add (shopping_list_id, product_id, amount) rows to the list items.
+
+    Amounts change with one UPDATE of F() per list, so concurrent writers
+    add up instead of overwriting each other. Rows are locked in product
+    order first to keep concurrent writers from deadlocking. Items that
+    grow are unchecked. Items that drop to zero are kept, so a concurrent
+    add never increments a row deleted under it; readers skip them.
+    """
+    deltas = defaultdict(lambda: defaultdict(int))
+    for shopping_list_id, product_id, amount in rows:
+        deltas[shopping_list_id][product_id] += sign * amount
+    if not deltas:
+        return
+    with transaction.atomic():
+        if sign > 0:
+            ShoppingListItem.objects.bulk_create(
+                (
+                    ShoppingListItem(
+                        shopping_list_id=shopping_list_id,
+                        product_id=product_id,
+                    )
+                    for shopping_list_id, amounts in deltas.items()
+                    for product_id in amounts
+                ),
+                ignore_conflicts=True,
+            )
+        for shopping_list_id, amounts in sorted(deltas.items()):
+            items = ShoppingListItem.objects.filter(
+                shopping_list_id=shopping_list_id, product_id__in=amounts
+            )
+            list(items.select_for_update().order_by('product_id').values('pk'))
+            changes = {'amount': Greatest(F('amount') + Case(
+                *(
+                    When(product_id=product_id, then=Value(amount))
+                    for product_id, amount in amounts.items()
+                ),
+                default=Value(0),
+            ), 0)}
+            if sign > 0:
+                changes['checked'] = False
+            items.update(**changes)
+
+
+def get_ingredient_rows(recipe_ids):
+    """(recipe_id, product_id, amount) rows of the recipes."""
+    return RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('recipe_id', 'product_id', 'amount')
+
+
+def change_recipe_items(rows, sign=1):
+    """Apply (recipe_id, product_id, amount) rows to lists with the recipe.
+
+    Called when recipe ingredients are added or removed.
+    """
+    rows = list(rows)
+    lists = defaultdict(list)
+    for recipe_id, shopping_list_id in ShoppingListRecipe.objects.filter(
+        recipe_id__in={recipe_id for recipe_id, _, _ in rows}
+    ).values_list('recipe_id', 'shopping_list_id'):
+        lists[recipe_id].append(shopping_list_id)
+    change_list_items(
+        (
+            (shopping_list_id, product_id, amount)
+            for recipe_id, product_id, amount in rows
+            for shopping_list_id in lists[recipe_id]
+        ),
+        sign,
+    )
+
+
+def add_recipe(shopping_list, recipe):
+    """Add recipe ingredients to the list, False if it is already there."""
+    with transaction.atomic():
+        _, created = ShoppingListRecipe.objects.get_or_create(
+            shopping_list=shopping_list, recipe=recipe
+        )
+        if created:
+            change_list_items(
+                (shopping_list.pk, product_id, amount)
+                for _, product_id, amount in get_ingredient_rows((recipe.pk,))
+            )
+    return created
+
+
+def remove_recipes(list_recipes):
+    """Delete ShoppingListRecipe rows and subtract their ingredients.
+
+    Returns the number of rows deleted.
+    """
+    with transaction.atomic():
+        removed = list(list_recipes.select_for_update().values_list(
+            'pk', 'shopping_list_id', 'recipe_id'
+        ))
+        if not removed:
+            return 0
+        ShoppingListRecipe.objects.filter(
+            pk__in=[pk for pk, _, _ in removed]
+        ).delete()
+        lists = defaultdict(list)
+        for _, shopping_list_id, recipe_id in removed:
+            lists[recipe_id].append(shopping_list_id)
+        change_list_items(
+            (
+                (shopping_list_id, product_id, amount)
+                for recipe_id, product_id, amount in get_ingredient_rows(lists)
+                for shopping_list_id in lists[recipe_id]
+            ),
+            sign=-1,
+        )
+    return len(removed)
+
+
+def get_shopping_list_text(shopping_list):
+    """Items of the shopping list as text, purchased ones marked."""
+    text = f'{shopping_list.name}:\n\n'
+    for name, amount, measurement_unit, checked in (
+        shopping_list.items.filter(amount__gt=0).values_list(
+            'product__name', 'amount', 'product__measurement_unit', 'checked'
+        ).order_by('product__name')
+    ):
+        text += (
+            f'[{"x" if checked else " "}] {name}, {amount} '
+            f'{measurement_unit}\n'
+        )
+    return text
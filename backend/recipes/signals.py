@@ -0,0 +1,313 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+from django.utils import timezone
+from foodgram.softdelete import soft_deleted
+from jobs.models import Job
+from jobs.queue import enqueue
+
+from recipes import catalog, events, shopping_lists, totals
+from recipes.images import save_webp_variant
+from recipes.models import (CatalogChange, Favorite, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart,
+                            ShoppingListRecipe, SimilarityChange, Tag)
+from recipes.toggles import toggles_flushed
+from users.models import Follow, User
+
+
+def touch_recipes(recipes):
+    """Bump updated_at of recipes whose payload changed."""
+    recipes.update(updated_at=timezone.now())
+    catalog.log_changes(
+        CatalogChange.RECIPE, recipes.values_list('pk', flat=True)
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(sender, instance, created, **kwargs):
+    if created:
+        enqueue('fan_out_recipe', recipe_id=instance.pk)
+
+
+@receiver(post_save, sender=Recipe)
+def notify_recipe(sender, instance, created, **kwargs):
+    if created:
+        events.notify(
+            {'type': 'recipe', 'id': instance.pk, 'author': instance.author_id}
+        )
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def log_recipe_change(sender, instance, **kwargs):
+    catalog.log_changes(CatalogChange.RECIPE, (instance.pk,))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def log_tag_change(sender, instance, **kwargs):
+    catalog.log_changes(CatalogChange.TAG, (instance.pk,))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def log_ingredient_change(sender, instance, **kwargs):
+    catalog.log_changes(CatalogChange.INGREDIENT, (instance.pk,))
+
+
+@receiver(post_save, sender=Recipe)
+def save_image_variants(sender, instance, **kwargs):
+    save_webp_variant(instance.image)
+
+
+@receiver(post_save, sender=Follow)
+def add_subscription(sender, instance, created, **kwargs):
+    if created:
+        enqueue(
+            'add_subscription',
+            user_id=instance.user_id,
+            author_id=instance.author_id,
+        )
+
+
+@receiver(post_delete, sender=Follow)
+def remove_subscription(sender, instance, **kwargs):
+    enqueue(
+        'remove_subscription',
+        user_id=instance.user_id,
+        author_id=instance.author_id,
+    )
+
+
+def notify_follow(follow, followed):
+    events.notify({
+        'type': 'follow',
+        'user': follow.user_id,
+        'author': follow.author_id,
+        'followed': followed,
+    })
+
+
+@receiver(post_save, sender=Follow)
+def notify_follow_added(sender, instance, created, **kwargs):
+    if created:
+        notify_follow(instance, True)
+
+
+@receiver(post_delete, sender=Follow)
+def notify_follow_removed(sender, instance, **kwargs):
+    notify_follow(instance, False)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def touch_recipe_relations(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            touch_recipes(Recipe.objects.filter(pk=instance.pk))
+    elif action in ('post_add', 'post_remove'):
+        touch_recipes(Recipe.objects.filter(pk__in=pk_set))
+    elif action == 'pre_clear':
+        touch_recipes(instance.recipes.all())
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def touch_recipe_ingredient(sender, instance, **kwargs):
+    touch_recipes(Recipe.objects.filter(pk=instance.recipe_id))
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def add_ingredient_totals(sender, instance, created, **kwargs):
+    if created:
+        totals.change_totals(
+            ((instance.recipe_id, instance.product_id, instance.amount),)
+        )
+    else:
+        totals.recompute_totals(Recipe.objects.filter(pk=instance.recipe_id))
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def subtract_ingredient_totals(sender, instance, **kwargs):
+    totals.change_totals(
+        ((instance.recipe_id, instance.product_id, instance.amount),),
+        sign=-1,
+    )
+
+
+@receiver(pre_save, sender=RecipeIngredient)
+def remember_ingredient_row(sender, instance, **kwargs):
+    instance._saved_row = None
+    if instance.pk is not None:
+        instance._saved_row = RecipeIngredient.objects.filter(
+            pk=instance.pk
+        ).values_list('recipe_id', 'product_id', 'amount').first()
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def add_shopping_list_items(sender, instance, created, **kwargs):
+    row = (instance.recipe_id, instance.product_id, instance.amount)
+    if created or row != instance._saved_row:
+        if instance._saved_row is not None:
+            shopping_lists.change_recipe_items(
+                (instance._saved_row,), sign=-1
+            )
+        shopping_lists.change_recipe_items((row,))
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def subtract_shopping_list_items(sender, instance, **kwargs):
+    shopping_lists.change_recipe_items(
+        ((instance.recipe_id, instance.product_id, instance.amount),),
+        sign=-1,
+    )
+
+
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def add_relation_shopping_list_items(sender, instance, action, reverse,
+                                     pk_set, **kwargs):
+    if action == 'post_add':
+        rows = (
+            RecipeIngredient.objects.filter(
+                product=instance, recipe_id__in=pk_set
+            ) if reverse
+            else RecipeIngredient.objects.filter(
+                recipe=instance, product_id__in=pk_set
+            )
+        )
+        shopping_lists.change_recipe_items(
+            rows.values_list('recipe_id', 'product_id', 'amount')
+        )
+
+
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def add_relation_totals(sender, instance, action, reverse, pk_set, **kwargs):
+    # Removed rows are deleted one by one and handled by post_delete,
+    # added ones are bulk inserted without post_save.
+    if action == 'post_add':
+        totals.recompute_totals(
+            Recipe.objects.filter(pk__in=pk_set) if reverse
+            else Recipe.objects.filter(pk=instance.pk)
+        )
+
+
+@receiver(pre_save, sender=Ingredient)
+def remember_ingredient_rates(sender, instance, **kwargs):
+    instance._saved_rates = None
+    if instance.pk is not None:
+        instance._saved_rates = Ingredient.objects.filter(
+            pk=instance.pk
+        ).values_list(*(rate for _, rate in totals.TOTALS)).first()
+
+
+@receiver(post_save, sender=Ingredient)
+def recompute_ingredient_totals(sender, instance, created, **kwargs):
+    rates = tuple(getattr(instance, rate) for _, rate in totals.TOTALS)
+    if not created and rates != instance._saved_rates:
+        totals.recompute_totals(instance.recipes.all())
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def touch_related_recipes(sender, instance, created, **kwargs):
+    if not created:
+        touch_recipes(instance.recipes.all())
+
+
+@receiver(post_save, sender=User)
+def touch_author_recipes(sender, instance, created, update_fields=None,
+                         **kwargs):
+    if created or (
+        update_fields is not None and set(update_fields) == {'last_login'}
+    ):
+        return
+    touch_recipes(instance.recipes.all())
+
+
+@receiver(soft_deleted, sender=User)
+def soft_delete_author_recipes(sender, pks, **kwargs):
+    Recipe.objects.filter(author_id__in=pks).soft_delete()
+
+
+@receiver(soft_deleted, sender=Recipe)
+def log_soft_deleted_recipes(sender, pks, **kwargs):
+    catalog.log_changes(CatalogChange.RECIPE, pks)
+
+
+@receiver(soft_deleted, sender=Recipe)
+def remove_from_shopping_lists(sender, pks, **kwargs):
+    shopping_lists.remove_recipes(
+        ShoppingListRecipe.objects.filter(recipe_id__in=pks)
+    )
+
+
+@receiver(soft_deleted, sender=User)
+@receiver(soft_deleted, sender=Recipe)
+def schedule_purge(sender, **kwargs):
+    def enqueue_purge():
+        if not Job.objects.filter(
+            name='purge_deleted', status=Job.QUEUED
+        ).exists():
+            enqueue('purge_deleted')
+
+    transaction.on_commit(enqueue_purge)
+
+
+@receiver(post_save, sender=Favorite)
+def add_favorites_count(sender, instance, created, **kwargs):
+    if created:
+        Recipe.objects.filter(pk=instance.recipe_id).update(
+            favorites_count=F('favorites_count') + 1
+        )
+
+
+@receiver(post_delete, sender=Favorite)
+def subtract_favorites_count(sender, instance, **kwargs):
+    Recipe.objects.filter(pk=instance.recipe_id).update(
+        favorites_count=F('favorites_count') - 1
+    )
+
+
+@receiver(toggles_flushed, sender=Favorite)
+def change_flushed_favorites_counts(sender, added, removed, **kwargs):
+    Recipe.objects.filter(pk__in=added | removed).update(
+        favorites_count=F('favorites_count') + Case(
+            When(pk__in=added, then=Value(1)), default=Value(-1)
+        )
+    )
+
+
+def mark_similarity_changes(recipe_ids):
+    def mark():
+        now = timezone.now()
+        # The recipes themselves may have been deleted with their
+        # favorites.
+        try:
+            SimilarityChange.objects.bulk_create(
+                (SimilarityChange(recipe_id=recipe_id, changed_at=now)
+                 for recipe_id in recipe_ids),
+                update_conflicts=True,
+                update_fields=('changed_at',),
+                unique_fields=('recipe',),
+            )
+        except IntegrityError:
+            pass
+
+    transaction.on_commit(mark)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def mark_similarity_change(sender, instance, **kwargs):
+    mark_similarity_changes((instance.recipe_id,))
+
+
+@receiver(toggles_flushed, sender=Favorite)
+@receiver(toggles_flushed, sender=ShoppingCart)
+def mark_flushed_similarity_changes(sender, added, removed, **kwargs):
+    mark_similarity_changes(sorted(added | removed))
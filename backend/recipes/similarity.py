@@ -0,0 +1,154 @@
+import numpy as np
+from django.conf import settings
+from django.db import models, transaction
+from scipy import sparse
+
+from recipes.models import (Favorite, Recipe, ShoppingCart, SimilarityChange,
+                            SimilarRecipe)
+from users.models import User
+
+INTERACTION_WEIGHTS = ((Favorite, 1.0), (ShoppingCart, 0.5))
+
+
+def load_interactions():
+    """User x recipe matrix of favorite and shopping cart weights.
+
+    Users and recipes are indexed by their ids. Rows of soft-deleted
+    users and recipes are left out.
+    """
+    shape = [
+        (User.objects.aggregate(max_id=models.Max('id'))['max_id'] or 0) + 1,
+        (Recipe.objects.aggregate(max_id=models.Max('id'))['max_id'] or 0)
+        + 1,
+    ]
+    users, recipes, weights = [], [], []
+    for model, weight in INTERACTION_WEIGHTS:
+        pairs = np.array(
+            model.objects.filter(
+                user__deleted_at__isnull=True,
+                recipe__deleted_at__isnull=True,
+            ).order_by().values_list('user_id', 'recipe_id'),
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        # Users and recipes created after the ids were counted.
+        if len(pairs):
+            shape[0] = max(shape[0], int(pairs[:, 0].max()) + 1)
+            shape[1] = max(shape[1], int(pairs[:, 1].max()) + 1)
+        users.append(pairs[:, 0])
+        recipes.append(pairs[:, 1])
+        weights.append(np.full(len(pairs), weight))
+    # Duplicate cells (favorite and cart) are summed.
+    return sparse.csr_matrix(
+        (np.concatenate(weights),
+         (np.concatenate(users), np.concatenate(recipes))),
+        shape=tuple(shape),
+    )
+
+
+def get_neighbors(by_user, by_recipe, norms, recipe_ids, count):
+    """Top count recipes by cosine similarity for each of recipe_ids.
+
+    by_user and by_recipe are the CSR and CSC forms of the interactions.
+    """
+    scale = np.divide(1, norms, out=np.zeros_like(norms), where=norms > 0)
+    scores = (
+        sparse.diags(scale[recipe_ids])
+        @ (by_recipe[:, recipe_ids].T @ by_user)
+        @ sparse.diags(scale)
+    ).tocsr()
+    for row, recipe_id in enumerate(recipe_ids):
+        start, end = scores.indptr[row], scores.indptr[row + 1]
+        similar_ids = scores.indices[start:end]
+        values = scores.data[start:end]
+        keep = similar_ids != recipe_id
+        similar_ids, values = similar_ids[keep], values[keep]
+        if len(values) > count:
+            top = np.argpartition(-values, count)[:count]
+            similar_ids, values = similar_ids[top], values[top]
+        yield recipe_id, zip(similar_ids.tolist(), values.tolist())
+
+
+def get_affected(interactions, by_recipe, changed_ids):
+    """Ids of the recipes whose neighbors changes to changed_ids touch.
+
+    Those are the changed recipes, the ones sharing a user with them and
+    the ones listing them as neighbors.
+    """
+    changed = np.array(
+        [pk for pk in changed_ids if pk < interactions.shape[1]],
+        dtype=np.int64,
+    )
+    users = np.unique(by_recipe[:, changed].indices)
+    listing = np.fromiter(
+        SimilarRecipe.objects.filter(
+            similar_id__in=list(changed_ids)
+        ).order_by().values_list('recipe_id', flat=True).distinct(),
+        dtype=np.int64,
+    )
+    return np.union1d(
+        np.union1d(changed, interactions[users].indices), listing
+    )
+
+
+def refresh_similar_recipes(changed_ids=None, changes=None):
+    """Recompute neighbors of every recipe, or of the ones affected by
+    changes to changed_ids.
+
+    changes, a queryset of SimilarityChange marks, is deleted along with
+    the last neighbors saved, so a failed refresh keeps the marks.
+    Returns the number of recipes refreshed.
+    """
+    interactions = load_interactions()
+    norms = np.sqrt(
+        np.asarray(interactions.multiply(interactions).sum(axis=0)).ravel()
+    )
+    by_recipe = interactions.tocsc()
+    if changed_ids is None:
+        recipe_ids = Recipe.objects.values_list('id', flat=True)
+    else:
+        recipe_ids = get_affected(
+            interactions, by_recipe, changed_ids
+        ).tolist()
+    recipe_ids = np.array(
+        [pk for pk in recipe_ids if pk < interactions.shape[1]],
+        dtype=np.int64,
+    )
+    block_size = settings.SIMILAR_RECIPES_BLOCK_SIZE
+    starts = range(0, len(recipe_ids), block_size)
+    if changes is not None and not starts:
+        changes.delete()
+    for start in starts:
+        block = recipe_ids[start:start + block_size]
+        rows = [
+            SimilarRecipe(recipe_id=recipe_id, similar_id=similar_id,
+                          score=score)
+            for recipe_id, neighbors in get_neighbors(
+                interactions, by_recipe, norms, block,
+                settings.SIMILAR_RECIPES_COUNT
+            )
+            for similar_id, score in neighbors
+        ]
+        with transaction.atomic():
+            SimilarRecipe.objects.filter(recipe_id__in=block.tolist()).delete()
+            SimilarRecipe.objects.bulk_create(rows)
+            if changes is not None and start == starts[-1]:
+                changes.delete()
+    return len(recipe_ids)
+
+
+def get_changes():
+    """Ids of recipes marked as changed and a queryset of their marks.
+
+    Marks set again after the call are left out of the queryset, so the
+    changes they record wait for the next refresh.
+    """
+    marks = list(
+        SimilarityChange.objects.values_list('recipe_id', 'changed_at')
+    )
+    if not marks:
+        return [], SimilarityChange.objects.none()
+    recipe_ids = [recipe_id for recipe_id, _ in marks]
+    return recipe_ids, SimilarityChange.objects.filter(
+        recipe_id__in=recipe_ids,
+        changed_at__lte=max(changed_at for _, changed_at in marks),
+    )
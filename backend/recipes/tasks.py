@@ -0,0 +1,189 @@
+import csv
+import os
+import shutil
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import models
+from django.utils.module_loading import import_string
+from foodgram.softdelete import purge
+
+from jobs.models import job_file_path
+from jobs.queue import LeaseLost, check_lease, periodic, task
+from recipes import feed
+from recipes.catalog import prune_changes
+from recipes.export import export_recipes, truncate_to_last_record
+from recipes.models import Favorite, Ingredient, Recipe, RecipeIngredient
+from recipes.toggles import flush_pending, is_write_behind
+from recipes.totals import recount_favorites
+from users.models import User
+
+
+def get_purchase_list(user):
+    """Summed ingredients of the user shopping cart as text."""
+    ingredients = (
+        RecipeIngredient.objects.filter(
+            recipe__shopping_cart__user=user, recipe__deleted_at__isnull=True
+        )
+        .values("product_id__name", "product_id__measurement_unit")
+        .annotate(models.Sum("amount"))
+    )
+    purchase_list_text = 'Purchase list:\n\n'
+    for item in ingredients:
+        purchase_list_text += (
+            f'{item["product_id__name"]}, {item["amount__sum"]} '
+            f'{item["product_id__measurement_unit"]}\n'
+        )
+    return purchase_list_text
+
+
+def load_ingredients(path):
+    """Create ingredients from a name,measurement_unit csv file."""
+    with open(path, 'r', encoding="utf-8") as csvfile:
+        csvreader = csv.DictReader(
+            csvfile, fieldnames=("name", "measurement_unit")
+        )
+        ingredients = [Ingredient(**row) for row in csvreader]
+    return len(Ingredient.objects.bulk_create(ingredients))
+
+
+@task('fan_out_recipe')
+def fan_out_recipe(job, recipe_id):
+    feed.fan_out_recipe(recipe_id)
+
+
+@task('add_subscription')
+def add_subscription(job, user_id, author_id):
+    feed.add_subscription(user_id, author_id)
+
+
+@task('remove_subscription')
+def remove_subscription(job, user_id, author_id):
+    feed.remove_subscription(user_id, author_id)
+
+
+@task('shopping_list')
+def export_shopping_list(job):
+    job.file.save(
+        'purchase_list.txt',
+        ContentFile(get_purchase_list(job.user).encode()),
+        save=False,
+    )
+
+
+@task('upload_ingredients')
+def upload_ingredients(job, path):
+    return {'created': load_ingredients(path)}
+
+
+@task('export_ingredients')
+def export_ingredients(job, file_format, search=''):
+    from recipes.admin import IngredientResource
+
+    file_format = import_string(file_format)()
+    queryset = Ingredient.objects.all()
+    if search:
+        queryset = queryset.filter(name__icontains=search)
+    dataset = IngredientResource().export(queryset)
+    data = file_format.export_data(dataset)
+    if not file_format.is_binary():
+        data = data.encode()
+    job.file.save(
+        f'ingredients.{file_format.get_extension()}',
+        ContentFile(data),
+        save=False,
+    )
+    return {'exported': len(dataset)}
+
+
+@task('import_ingredients')
+def import_ingredients(job, input_format, import_file_name, encoding=None):
+    from import_export.results import RowResult
+    from import_export.tmp_storages import MediaStorage
+
+    from recipes.admin import IngredientResource
+
+    input_format = import_string(input_format)(encoding=encoding)
+    tmp_storage = MediaStorage(
+        name=import_file_name,
+        encoding=encoding,
+        read_mode=input_format.get_read_mode(),
+    )
+    dataset = input_format.create_dataset(tmp_storage.read())
+    result = IngredientResource().import_data(
+        dataset, dry_run=False, raise_errors=True, user=job.user
+    )
+    tmp_storage.remove()
+    return {
+        'new': result.totals[RowResult.IMPORT_TYPE_NEW],
+        'updated': result.totals[RowResult.IMPORT_TYPE_UPDATE],
+    }
+
+
+@task('export_recipes')
+def export_recipes_file(job, export_format, after=0):
+    name = job_file_path(job, f'recipes.{export_format}')
+    path = default_storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Each attempt writes its own part file, so a worker that lost the
+    # job never writes into the file of the one that took it over.
+    partial = f'{path}.{job.attempts}.part'
+    previous = [f'{path}.{attempt}.part' for attempt in range(job.attempts)]
+    mode = 'w'
+    # A retried job continues from a copy of the last attempt's NDJSON.
+    for previous_path in reversed(previous):
+        if export_format == 'ndjson' and os.path.exists(previous_path):
+            shutil.copyfile(previous_path, partial)
+            after = truncate_to_last_record(partial) or after
+            mode = 'a'
+            break
+    count = 0
+    with open(partial, mode, encoding='utf-8', newline='') as output:
+        for line in export_recipes(
+            export_format, after, settings.EXPORT_CHUNK_SIZE
+        ):
+            output.write(line)
+            count += 1
+    try:
+        check_lease(job)
+    except LeaseLost:
+        os.remove(partial)
+        raise
+    os.replace(partial, path)
+    for previous_path in previous:
+        if os.path.exists(previous_path):
+            os.remove(previous_path)
+    job.file.name = name
+    return {'exported': count}
+
+
+@task('purge_deleted')
+def purge_deleted(job):
+    # Recipes first: users' recipes are soft-deleted along with them.
+    purged = {'recipes': purge(Recipe, settings.PURGE_BATCH_SIZE)}
+    # Purge sends no signals, so the favorites of the users are
+    # recounted once they are gone.
+    favorited = list(
+        Favorite.objects.filter(
+            user__deleted_at__isnull=False
+        ).order_by('recipe_id').values_list('recipe_id', flat=True).distinct()
+    )
+    purged['users'] = purge(User, settings.PURGE_BATCH_SIZE)
+    batch_size = settings.TOTALS_BATCH_SIZE
+    for start in range(0, len(favorited), batch_size):
+        recount_favorites(
+            Recipe.objects.filter(pk__in=favorited[start:start + batch_size])
+        )
+    return purged
+
+
+@task('prune_catalog_changes')
+def prune_catalog_changes(job):
+    return {'deleted': prune_changes()}
+
+
+@periodic('flush_toggles', settings.TOGGLES_FLUSH_INTERVAL)
+def flush_toggles():
+    if is_write_behind():
+        flush_pending()
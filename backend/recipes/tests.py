@@ -0,0 +1,398 @@
+import contextlib
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from jobs.models import Job, job_file_path
+from jobs.queue import LeaseLost, claim_jobs, enqueue, tasks
+
+from recipes.export import export_recipes
+from recipes.models import (Favorite, FeedEntry, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, SimilarityChange,
+                            SimilarRecipe, Tag)
+from recipes.similarity import refresh_similar_recipes
+from recipes.toggles import TOGGLES_KEY, flush
+from users.models import Follow, User
+
+
+class LoadRecipesTests(TransactionTestCase):
+    """load_recipes command, which closes the connections it inherits."""
+
+    def setUp(self):
+        User.objects.create_user(
+            username='author', email='author@example.com', password='x'
+        )
+        Tag.objects.create(name='Breakfast', slug='breakfast')
+        self.ingredient = Ingredient.objects.create(
+            name='salt', measurement_unit='g'
+        )
+
+    def get_record(self, name, **fields):
+        record = {
+            'name': name,
+            'text': 'Text',
+            'cooking_time': 10,
+            'image': 'recipes/images/image.jpg',
+            'author': 'author',
+            'tags': ['breakfast'],
+            'ingredients': [{'id': self.ingredient.pk, 'amount': 5}],
+        }
+        record.update(fields)
+        return json.dumps(record)
+
+    def load(self, lines, batch_size):
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson') as file:
+            file.write('\n'.join(lines) + '\n')
+            file.flush()
+            out = StringIO()
+            call_command(
+                'load_recipes', file.name, batch_size=batch_size,
+                workers=1, stdout=out, stderr=StringIO(),
+            )
+        return out.getvalue()
+
+    def test_invalid_first_batch(self):
+        out = self.load(
+            [
+                '{not json',
+                self.get_record('Bad', cooking_time=0),
+                self.get_record('First'),
+                self.get_record('Second'),
+                self.get_record('Third'),
+            ],
+            batch_size=2,
+        )
+        self.assertIn('Loaded 3 recipes, skipped 2.', out)
+        self.assertQuerysetEqual(
+            Recipe.objects.order_by('pk').values_list('name', flat=True),
+            ['First', 'Second', 'Third'],
+        )
+
+
+def create_recipe(author, name='Recipe', **fields):
+    return Recipe.objects.create(
+        author=author,
+        name=name,
+        text='Text',
+        cooking_time=10,
+        image='recipes/images/image.jpg',
+        **fields,
+    )
+
+
+class SimilarRecipesTests(TestCase):
+    """Similar recipes from co-favorites."""
+
+    def test_soft_deleted_rows_are_left_out(self):
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='x'
+        )
+        first, second, deleted = (
+            create_recipe(author, name) for name in ('First', 'Second', 'Gone')
+        )
+        for user in (author, User.objects.create_user(
+            username='reader', email='reader@example.com', password='x'
+        )):
+            for recipe in (first, second, deleted):
+                Favorite.objects.create(user=user, recipe=recipe)
+        Recipe.objects.filter(pk=deleted.pk).soft_delete()
+        User.objects.filter(username='reader').soft_delete()
+        self.assertEqual(refresh_similar_recipes(), 2)
+        self.assertQuerysetEqual(
+            SimilarRecipe.objects.order_by('recipe_id').values_list(
+                'recipe_id', 'similar_id'
+            ),
+            [(first.pk, second.pk), (second.pk, first.pk)],
+        )
+
+
+class SimilarityRefreshTests(TestCase):
+    """Incremental refresh of similar recipes from change marks."""
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                username=f'user{index}', email=f'user{index}@example.com',
+                password='x',
+            )
+            for index in range(3)
+        ]
+        self.first, self.second, self.third = (
+            create_recipe(self.users[0], name)
+            for name in ('First', 'Second', 'Third')
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            for user, recipe in (
+                (self.users[0], self.first), (self.users[0], self.second),
+                (self.users[1], self.first), (self.users[1], self.third),
+            ):
+                Favorite.objects.create(user=user, recipe=recipe)
+        call_command('build_similar_recipes', stdout=StringIO())
+
+    def get_scores(self):
+        return {
+            (recipe_id, similar_id): round(score, 6)
+            for recipe_id, similar_id, score in
+            SimilarRecipe.objects.values_list(
+                'recipe_id', 'similar_id', 'score'
+            )
+        }
+
+    def test_neighbors_of_changed_recipes_are_refreshed(self):
+        self.assertFalse(SimilarityChange.objects.exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            Favorite.objects.create(user=self.users[2], recipe=self.first)
+        call_command('build_similar_recipes', stdout=StringIO())
+        incremental = self.get_scores()
+        self.assertFalse(SimilarityChange.objects.exists())
+        call_command('build_similar_recipes', full=True, stdout=StringIO())
+        self.assertEqual(incremental, self.get_scores())
+
+    def test_failed_refresh_keeps_marks(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Favorite.objects.create(user=self.users[2], recipe=self.first)
+        with mock.patch(
+            'recipes.similarity.get_neighbors', side_effect=MemoryError
+        ), self.assertRaises(MemoryError):
+            call_command('build_similar_recipes', stdout=StringIO())
+        self.assertQuerysetEqual(
+            SimilarityChange.objects.values_list('recipe_id', flat=True),
+            [self.first.pk],
+        )
+
+
+class FavoritesCountTests(TestCase):
+    """favorites_count kept by the Favorite signals."""
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='x'
+        )
+        self.recipe = create_recipe(self.author)
+
+    def test_save_keeps_concurrent_count(self):
+        stale = Recipe.objects.get(pk=self.recipe.pk)
+        Favorite.objects.create(user=self.author, recipe=self.recipe)
+        stale.name = 'Renamed'
+        stale.save()
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.name, 'Renamed')
+        self.assertEqual(self.recipe.favorites_count, 1)
+
+    def test_purge_recounts_favorites_of_users(self):
+        reader = User.objects.create_user(
+            username='reader', email='reader@example.com', password='x'
+        )
+        Favorite.objects.create(user=self.author, recipe=self.recipe)
+        Favorite.objects.create(user=reader, recipe=self.recipe)
+        User.objects.filter(pk=reader.pk).soft_delete()
+        self.assertEqual(
+            tasks['purge_deleted'](None), {'recipes': 0, 'users': 1}
+        )
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+
+    def test_recount_favorites(self):
+        Favorite.objects.create(user=self.author, recipe=self.recipe)
+        Recipe.objects.filter(pk=self.recipe.pk).update(favorites_count=7)
+        call_command('recount_favorites', stdout=StringIO())
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+
+
+class ToggleFlushTests(TestCase):
+    """Write-behind toggles written by flush."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='user', email='user@example.com', password='x'
+        )
+        self.added, self.removed, self.unchanged = (
+            create_recipe(self.user, name)
+            for name in ('Added', 'Removed', 'Unchanged')
+        )
+        for recipe in (self.removed, self.unchanged):
+            Favorite.objects.create(user=self.user, recipe=recipe)
+        # The buffer lock takes Redis; flush is run in one process here.
+        lock = mock.patch(
+            'recipes.toggles.buffer_lock',
+            lambda user_id: contextlib.nullcontext(),
+        )
+        lock.start()
+        self.addCleanup(lock.stop)
+
+    def test_flush_keeps_counts_and_marks(self):
+        key = TOGGLES_KEY.format(self.user.pk)
+        cache.set(key, {
+            ('favorite', self.added.pk): True,
+            ('favorite', self.removed.pk): False,
+            ('favorite', self.unchanged.pk): True,
+            ('shopping_cart', self.added.pk): True,
+        })
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(flush(self.user.pk), 4)
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(
+            dict(Recipe.objects.values_list('name', 'favorites_count')),
+            {'Added': 1, 'Removed': 0, 'Unchanged': 1},
+        )
+        self.assertQuerysetEqual(
+            ShoppingCart.objects.values_list('recipe_id', flat=True),
+            [self.added.pk],
+        )
+        self.assertEqual(
+            set(SimilarityChange.objects.values_list('recipe_id', flat=True)),
+            {self.added.pk, self.removed.pk},
+        )
+
+
+class TotalsTests(TestCase):
+    """Calorie and cost totals kept by the RecipeIngredient signals."""
+
+    def setUp(self):
+        self.recipe = create_recipe(User.objects.create_user(
+            username='author', email='author@example.com', password='x'
+        ))
+        self.ingredient = Ingredient.objects.create(
+            name='sugar', measurement_unit='g', calories=4, price=2
+        )
+
+    def test_save_keeps_concurrent_totals(self):
+        stale = Recipe.objects.get(pk=self.recipe.pk)
+        RecipeIngredient.objects.create(
+            recipe=self.recipe, product=self.ingredient, amount=10
+        )
+        stale.save()
+        self.recipe.refresh_from_db()
+        self.assertEqual(
+            (self.recipe.calories, self.recipe.cost), (40, 20)
+        )
+
+    def test_recompute_totals(self):
+        RecipeIngredient.objects.create(
+            recipe=self.recipe, product=self.ingredient, amount=10
+        )
+        Recipe.objects.filter(pk=self.recipe.pk).update(calories=1, cost=1)
+        call_command('recompute_totals', stdout=StringIO())
+        self.recipe.refresh_from_db()
+        self.assertEqual(
+            (self.recipe.calories, self.recipe.cost), (40, 20)
+        )
+
+
+def run_queued_jobs():
+    for job in Job.objects.filter(status=Job.QUEUED).order_by('pk'):
+        tasks[job.name](job, **job.params)
+        Job.objects.filter(pk=job.pk).update(status=Job.DONE)
+
+
+class FeedTests(TestCase):
+    """Subscription feed timelines."""
+
+    def setUp(self):
+        self.author, self.reader = (
+            User.objects.create_user(
+                username=name, email=f'{name}@example.com', password='x'
+            )
+            for name in ('author', 'reader')
+        )
+        self.old = create_recipe(self.author, 'Old')
+
+    def get_feed_ids(self):
+        return set(FeedEntry.objects.filter(
+            user=self.reader
+        ).values_list('recipe_id', flat=True))
+
+    def test_fan_out_runs_on_the_job_queue(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        new = create_recipe(self.author, 'New')
+        self.assertEqual(self.get_feed_ids(), set())
+        run_queued_jobs()
+        self.assertEqual(self.get_feed_ids(), {self.old.pk, new.pk})
+
+    def test_unfollow_before_backfill(self):
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        follow.delete()
+        run_queued_jobs()
+        self.assertEqual(self.get_feed_ids(), set())
+
+    def test_backfill_feeds(self):
+        Follow.objects.bulk_create(
+            (Follow(user=self.reader, author=self.author),)
+        )
+        call_command('backfill_feeds', stdout=StringIO())
+        self.assertEqual(self.get_feed_ids(), {self.old.pk})
+
+
+class ExportTests(TestCase):
+    """export_recipes job files."""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        create_recipe(User.objects.create_user(
+            username='author', email='author@example.com', password='x'
+        ))
+        Job.objects.all().delete()
+        self.job_id = enqueue('export_recipes', export_format='ndjson').pk
+        claim_jobs(1)
+
+    def test_export_replaces_file(self):
+        job = Job.objects.get(pk=self.job_id)
+        result = tasks['export_recipes'](job, **job.params)
+        self.assertEqual(result, {'exported': 1})
+        path = default_storage.path(job.file.name)
+        with open(path, encoding='utf-8') as file:
+            self.assertEqual(json.loads(file.read())['name'], 'Recipe')
+        self.assertEqual(os.listdir(os.path.dirname(path)), ['recipes.ndjson'])
+
+    def test_recipes_are_read_in_keyset_chunks(self):
+        author = User.objects.get()
+        for name in ('Second', 'Third'):
+            create_recipe(author, name)
+        # Three queries per chunk of two, one for the empty last chunk.
+        with self.assertNumQueries(7):
+            lines = list(export_recipes('ndjson', chunk_size=2))
+        self.assertEqual(
+            [json.loads(line)['name'] for line in lines],
+            ['Recipe', 'Second', 'Third'],
+        )
+
+    def test_requeued_attempt_leaves_file_alone(self):
+        job = Job.objects.get(pk=self.job_id)
+        Job.objects.update(status=Job.QUEUED)
+        claim_jobs(1)
+        with self.assertRaises(LeaseLost):
+            tasks['export_recipes'](job, **job.params)
+        name = job_file_path(job, 'recipes.ndjson')
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(default_storage.exists(f'{name}.1.part'))
+
+    def test_retry_continues_from_previous_part(self):
+        job = Job.objects.get(pk=self.job_id)
+        path = default_storage.path(job_file_path(job, 'recipes.ndjson'))
+        os.makedirs(os.path.dirname(path))
+        with open(f'{path}.1.part', 'w', encoding='utf-8') as file:
+            file.write('{"id": %d, "name": "Done"}\n{"id": ' % (
+                Recipe.objects.get().pk
+            ))
+        Job.objects.update(status=Job.QUEUED)
+        claim_jobs(1)
+        job = Job.objects.get(pk=self.job_id)
+        self.assertEqual(
+            tasks['export_recipes'](job, **job.params), {'exported': 0}
+        )
+        with open(path, encoding='utf-8') as file:
+            self.assertEqual(
+                [json.loads(line)['name'] for line in file], ['Done']
+            )
+        self.assertEqual(os.listdir(os.path.dirname(path)), ['recipes.ndjson'])
@@ -0,0 +1,183 @@
+import logging
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.redis import RedisCache
+from django.db import models, transaction
+from django.dispatch import Signal
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+
+TOGGLES_KEY = 'toggles:{}'
+TOGGLES_LOCK_KEY = 'toggles:{}:lock'
+TOGGLES_PENDING_KEY = 'toggles:pending'
+# Toggle kind, its model and the related name of the model on Recipe.
+TOGGLE_MODELS = {'favorite': Favorite, 'shopping_cart': ShoppingCart}
+TOGGLE_RELATED_NAMES = {
+    'favorite': 'favorites',
+    'shopping_cart': 'shopping_cart',
+}
+
+logger = logging.getLogger(__name__)
+
+# Sent by flush with sender=toggle model, user_id and the sets of recipe
+# ids added and removed, in place of the signals of each row.
+toggles_flushed = Signal()
+
+
+def is_write_behind():
+    """Whether toggles are buffered; it takes the locks and sets of Redis."""
+    return settings.TOGGLES_WRITE_BEHIND and isinstance(
+        caches['default'], RedisCache
+    )
+
+
+def get_client(key):
+    """Redis client and the full name of the cache key."""
+    backend = caches['default']
+    key = backend.make_and_validate_key(key)
+    return backend._cache.get_client(key, write=True), key
+
+
+@contextmanager
+def buffer_lock(user_id):
+    """Serialize changes of the user buffer across processes.
+
+    A lock left by a dead process expires after TOGGLES_LOCK_TIMEOUT.
+    The lock holds a token of its owner and is released only by it;
+    waiting longer than TOGGLES_LOCK_TIMEOUT raises LockError.
+    """
+    client, key = get_client(TOGGLES_LOCK_KEY.format(user_id))
+    with client.lock(
+        key,
+        timeout=settings.TOGGLES_LOCK_TIMEOUT,
+        sleep=settings.TOGGLES_LOCK_POLL_INTERVAL,
+        blocking_timeout=settings.TOGGLES_LOCK_TIMEOUT,
+    ):
+        yield
+
+
+def get_buffer(user):
+    """Unwritten toggles of user as {(kind, recipe_id): state}."""
+    if not is_write_behind() or not user.is_authenticated:
+        return {}
+    return cache.get(TOGGLES_KEY.format(user.pk), {})
+
+
+def get_toggled(buffer, kind, state):
+    return {
+        recipe_id for (toggle_kind, recipe_id), toggle_state in buffer.items()
+        if toggle_kind == kind and toggle_state == state
+    }
+
+
+def merge_toggled(buffer, kind, recipe_ids):
+    """Stored recipe_ids of kind with the buffered toggles applied."""
+    return (
+        set(recipe_ids) | get_toggled(buffer, kind, True)
+    ) - get_toggled(buffer, kind, False)
+
+
+def filter_toggled(queryset, user, kind):
+    """Recipes of queryset the user has toggled on, buffer included."""
+    buffer = get_buffer(user)
+    stored = models.Q(**{f'{TOGGLE_RELATED_NAMES[kind]}__user': user})
+    if not buffer:
+        return queryset.filter(stored)
+    stored = models.Exists(TOGGLE_MODELS[kind].objects.filter(
+        user=user, recipe=models.OuterRef('pk')
+    ))
+    return queryset.filter(
+        stored | models.Q(pk__in=get_toggled(buffer, kind, True))
+    ).exclude(pk__in=get_toggled(buffer, kind, False))
+
+
+def toggle(user, kind, recipe_id, state):
+    """Buffer the kind toggle of recipe_id, False if it is already state.
+
+    Toggling back to the stored state drops the buffered toggle, so
+    add/remove pairs never reach the database.
+    """
+    key = TOGGLES_KEY.format(user.pk)
+    with buffer_lock(user.pk):
+        buffer = cache.get(key, {})
+        if (kind, recipe_id) in buffer:
+            if buffer[kind, recipe_id] == state:
+                return False
+            del buffer[kind, recipe_id]
+        else:
+            if TOGGLE_MODELS[kind].objects.filter(
+                user=user, recipe_id=recipe_id
+            ).exists() == state:
+                return False
+            buffer[kind, recipe_id] = state
+        if buffer:
+            cache.set(key, buffer, settings.TOGGLES_TIMEOUT)
+        else:
+            cache.delete(key)
+        client, pending_key = get_client(TOGGLES_PENDING_KEY)
+        client.sadd(pending_key, user.pk)
+    return True
+
+
+def flush(user_id):
+    """Write the buffered toggles of the user in one transaction.
+
+    Each kind takes one bulk insert and one DELETE, and toggles_flushed
+    stands in for the row signals; the buffer is dropped only after the
+    commit.
+    """
+    key = TOGGLES_KEY.format(user_id)
+    with buffer_lock(user_id):
+        buffer = cache.get(key)
+        if not buffer:
+            return 0
+        alive = set(Recipe.objects.filter(
+            pk__in={recipe_id for _, recipe_id in buffer}
+        ).values_list('pk', flat=True))
+        with transaction.atomic():
+            for kind, model in TOGGLE_MODELS.items():
+                rows = model.objects.filter(user_id=user_id)
+                stored = set(rows.filter(recipe_id__in={
+                    recipe_id for toggle_kind, recipe_id in buffer
+                    if toggle_kind == kind
+                }).values_list('recipe_id', flat=True))
+                added = (get_toggled(buffer, kind, True) & alive) - stored
+                removed = get_toggled(buffer, kind, False) & stored
+                model.objects.bulk_create(
+                    (model(user_id=user_id, recipe_id=recipe_id)
+                     for recipe_id in added),
+                    ignore_conflicts=True,
+                )
+                if removed:
+                    # No row signals: toggles_flushed carries their work.
+                    deleted = rows.filter(recipe_id__in=removed)
+                    deleted._raw_delete(deleted.db)
+                if added or removed:
+                    toggles_flushed.send(
+                        sender=model, user_id=user_id,
+                        added=added, removed=removed,
+                    )
+        cache.delete(key)
+    return len(buffer)
+
+
+def flush_pending():
+    """Flush the buffers of the users with pending toggles.
+
+    run_jobs calls it every TOGGLES_FLUSH_INTERVAL, so toggles buffered by
+    web workers that were killed are still written. Returns the number of
+    users flushed.
+    """
+    client, key = get_client(TOGGLES_PENDING_KEY)
+    user_ids = client.smembers(key)
+    for user_id in user_ids:
+        # A toggle made meanwhile adds the user back.
+        client.srem(key, user_id)
+        try:
+            flush(int(user_id))
+        except Exception:
+            logger.exception('Flushing toggles of user %s failed', user_id)
+            client.sadd(key, user_id)
+    return len(user_ids)
@@ -0,0 +1,66 @@
+from collections import defaultdict
+
+from django.db.models import Count, DecimalField, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Ingredient, Recipe, RecipeIngredient
+
+# Recipe total field and the ingredient rate it sums per measurement unit.
+TOTALS = (('calories', 'calories'), ('cost', 'price'))
+
+
+def change_totals(rows, sign=1):
+    """Add (recipe_id, product_id, amount) rows to the recipe totals.
+
+    With sign=-1 the rows are subtracted, so writes of a few ingredients
+    cost one UPDATE per recipe instead of a sum over all its ingredients.
+    """
+    rows = list(rows)
+    rates = {
+        pk: values
+        for pk, *values in Ingredient.objects.filter(
+            pk__in={product_id for _, product_id, _ in rows}
+        ).values_list('pk', *(rate for _, rate in TOTALS))
+    }
+    deltas = defaultdict(lambda: [0] * len(TOTALS))
+    for recipe_id, product_id, amount in rows:
+        for index, rate in enumerate(rates.get(product_id, ())):
+            if rate:
+                deltas[recipe_id][index] += sign * amount * rate
+    for recipe_id, values in deltas.items():
+        Recipe.objects.filter(pk=recipe_id).update(**{
+            total: F(total) + value
+            for (total, _), value in zip(TOTALS, values)
+            if value
+        })
+
+
+def recompute_totals(recipes):
+    """Set the totals of the recipes queryset from their ingredients."""
+    field = Recipe._meta.get_field('calories')
+    output_field = DecimalField(
+        max_digits=field.max_digits, decimal_places=field.decimal_places
+    )
+    ingredients = RecipeIngredient.objects.filter(
+        recipe_id=OuterRef('pk')
+    ).order_by().values('recipe_id')
+    return recipes.update(**{
+        total: Coalesce(
+            Subquery(ingredients.annotate(
+                total=Sum(F('amount') * F(f'product__{rate}'))
+            ).values('total'), output_field=output_field),
+            0,
+            output_field=output_field,
+        )
+        for total, rate in TOTALS
+    })
+
+
+def recount_favorites(recipes):
+    """Set favorites_count of the recipes queryset from Favorite rows."""
+    favorites = Favorite.objects.filter(
+        recipe_id=OuterRef('pk')
+    ).order_by().values('recipe_id').annotate(total=Count('pk'))
+    return recipes.update(
+        favorites_count=Coalesce(Subquery(favorites.values('total')), 0)
+    )
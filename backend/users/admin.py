@@ -1,13 +1,37 @@
 from django.contrib import admin
+from foodgram.admin import (EstimatedCountPaginator, SoftDeleteAdminMixin,
+                            count_subquery)
+from recipes.models import Recipe
 
-from .models import User
+from .models import Follow, User
 
 
 @admin.register(User)
-class UserAdmin(admin.ModelAdmin):
+class UserAdmin(SoftDeleteAdminMixin, admin.ModelAdmin):
     """UserAdmin class."""
 
     model = User
+    list_display = (
+        'username', 'email', 'first_name', 'last_name', 'recipes_count',
+        'followers_count',
+    )
     ordering = ('email',)
     search_fields = ('username', 'email',)
+    list_filter = ('is_staff', 'is_active',)
     empty_value_display = '-filter-'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            recipes_total=count_subquery(Recipe.objects.all(), 'author'),
+            followers_total=count_subquery(Follow.objects.all(), 'author'),
+        )
+
+    @admin.display(description='recipes', ordering='recipes_total')
+    def recipes_count(self, obj):
+        return obj.recipes_total
+
+    @admin.display(description='followers', ordering='followers_total')
+    def followers_count(self, obj):
+        return obj.followers_total
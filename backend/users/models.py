@@ -1,5 +1,10 @@
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.db import models
+from foodgram.softdelete import AliveManager
+
+
+class AliveUserManager(AliveManager, UserManager):
+    """User manager hiding soft-deleted users."""
 
 
 class User(AbstractUser):
@@ -31,6 +36,23 @@ class User(AbstractUser):
         max_length=128,
         verbose_name='Last Name'
     )
+    deleted_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Deletion Date',
+    )
+
+    objects = AliveUserManager()
+
+    class Meta(AbstractUser.Meta):
+        indexes = (
+            models.Index(
+                fields=('deleted_at',),
+                condition=models.Q(deleted_at__isnull=False),
+                name='user_deleted_idx'
+            ),
+        )
 
     def __str__(self) -> str:
         return self.username